@@ -0,0 +1,183 @@
+import re
+import shlex
+import time
+from dataclasses import dataclass, field
+
+# DCSS calls the Lua ready() hook each time it waits for a command at the main
+# prompt, and never in menus, --more-- or text prompts. Dumping the character
+# from there keeps a current dump on disk without pressing a key the model
+# didn't choose. The dump's message is muted so it stays out of the log too.
+DUMP_HOOK = """
+message_colour ^= mute:Char dumped
+{
+function ready()
+    if crawl.dump_char then
+        crawl.dump_char()
+    end
+end
+}
+"""
+# Shell command and check installing the hook into the game's init file
+DUMP_HOOK_COMMAND = (
+    f"mkdir -p ~/.crawl && printf %s {shlex.quote(DUMP_HOOK)} >> ~/.crawl/init.txt"
+)
+DUMP_HOOK_CHECK = "grep -q crawl.dump_char ~/.crawl/init.txt 2>/dev/null"
+
+# Prints the current character's dump, the one named after its save, so a
+# dump left by an earlier character is never read as the current state.
+# Before a save exists (character creation) it prints nothing. It runs in a
+# subshell to leave the model's shell, which instance.bash shares, untouched.
+DUMP_COMMAND = """(
+save=$(ls -t ~/.crawl/saves/*.cs 2>/dev/null | head -1)
+name=$(basename "$save" .cs)
+# Saves may carry a -<uid> suffix the dump doesn't
+for dump in ~/.crawl/morgue/"$name".txt ~/.crawl/morgue/"${name%-[0-9]*}".txt; do
+    [ -n "$save" ] && [ -f "$dump" ] && { cat "$dump"; break; }
+done
+true
+)"""
+
+# Dump sections that end the part before them
+SECTION_HEADINGS = (
+    "Inventory:",
+    "Skills:",
+    "Spells:",
+    "Dungeon Overview and Level Annotations",
+    "Innate Abilities, Weirdness & Mutations",
+    "Message History",
+    "Vanquished Creatures",
+    "Notes",
+    "Action",
+)
+# Messages DCSS logs about the dump itself
+DUMP_MESSAGE = re.compile(r"Char dumped|dumped to")
+
+
+def _section(lines: list, heading: str) -> list:
+    """Lines after `heading` up to the next known section heading."""
+    for start, line in enumerate(lines):
+        if line.strip().startswith(heading):
+            break
+    else:
+        return []
+    section = []
+    for line in lines[start + 1 :]:
+        if line.strip().startswith(SECTION_HEADINGS):
+            break
+        section.append(line.rstrip())
+    return section
+
+
+def _map_excerpt(lines: list, rows: int, cols: int) -> list:
+    """The part of the ASCII map around the player's @."""
+    for y, line in enumerate(lines):
+        x = line.find("@")
+        if x != -1:
+            top = max(y - rows, 0)
+            left = max(x - cols, 0)
+            return [
+                row[left : x + cols + 1].rstrip() for row in lines[top : y + rows + 1]
+            ]
+    return []
+
+
+@dataclass
+class GameState:
+    title: str = ""
+    stats: list = field(default_factory=list)
+    location: str = ""
+    inventory: list = field(default_factory=list)
+    messages: list = field(default_factory=list)
+    map: list = field(default_factory=list)
+
+    def to_text(self) -> str:
+        parts = [f"<game_state>\n{self.title}"]
+        if self.location:
+            parts.append(self.location)
+        parts += self.stats
+        if self.inventory:
+            parts.append("Inventory:\n" + "\n".join(self.inventory))
+        if self.messages:
+            parts.append("Recent messages:\n" + "\n".join(self.messages))
+        if self.map:
+            parts.append("Map around you (@):\n" + "\n".join(self.map))
+        return "\n".join(parts) + "\n</game_state>"
+
+
+def parse_dump(
+    dump: str,
+    max_messages: int = 12,
+    max_inventory: int = 26,
+    map_rows: int = 8,
+    map_cols: int = 25,
+) -> GameState | None:
+    """Compact game state from a DCSS character dump, or None if it isn't one."""
+    lines = dump.splitlines()
+    title = next((line.strip() for line in lines if "Turns:" in line), None)
+    if title is None:
+        return None
+
+    state = GameState(title=re.sub(r"\s{2,}", "  ", title))
+    # The stat block: HP/MP/AC/EV/Str/Int/Dex/XL/gold rows and the status line
+    state.stats = [
+        re.sub(r"\s{2,}", "  ", line.strip())
+        for line in lines
+        if re.match(r"\s*(Health|HP|Magic|MP|Gold)\b", line) or line.startswith("@:")
+    ]
+    state.location = next(
+        (line.strip() for line in lines if line.strip().startswith("You are ")), ""
+    )
+    state.inventory = [
+        line.strip() for line in _section(lines, "Inventory:") if line.strip()
+    ][:max_inventory]
+
+    # Message History is followed by a blank line, then the ASCII map
+    history = _section(lines, "Message History")
+    blank = next((i for i, line in enumerate(history) if not line.strip()), None)
+    if blank is not None and blank == 0:
+        history = history[1:]
+        blank = next((i for i, line in enumerate(history) if not line.strip()), None)
+    messages = history[:blank] if blank is not None else history
+    state.messages = [
+        line.strip()
+        for line in messages
+        if line.strip() and not DUMP_MESSAGE.search(line)
+    ][-max_messages:]
+    if blank is not None:
+        rest = history[blank + 1 :]
+        end = next((i for i, line in enumerate(rest) if not line.strip()), len(rest))
+        state.map = _map_excerpt(rest[:end], map_rows, map_cols)
+    return state
+
+
+@dataclass
+class StateReaderStats:
+    reads: int = 0
+    failures: int = 0
+    seconds: float = 0.0
+    chars: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"Game state read {self.reads} times ({self.failures} without a dump), "
+            f"{self.seconds:.1f}s, {self.chars // max(self.reads, 1)} chars per read"
+        )
+
+
+def read_state(instance, stats: StateReaderStats | None = None) -> GameState | None:
+    """Read the character's latest dump on the instance, None before a game exists.
+
+    The dump is the one the game wrote when it last waited at the main
+    prompt (see DUMP_HOOK), so the game gets no input from this.
+    """
+    started = time.perf_counter()
+    result = instance.bash(command=DUMP_COMMAND)
+    state = parse_dump((result or {}).get("output") or "")
+    if stats:
+        stats.reads += 1
+        stats.seconds += time.perf_counter() - started
+        if state:
+            stats.chars += len(state.to_text())
+        else:
+            stats.failures += 1
+    return state
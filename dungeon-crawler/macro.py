@@ -0,0 +1,153 @@
+import asyncio
+import re
+import shlex
+from typing import Any
+from anthropic.types.beta import BetaToolParam
+from scrapybara.anthropic.base import BaseAnthropicTool, ToolError, ToolResult
+
+GAME_WINDOW = "Crawl"
+MAX_KEYS = 50
+# Share of the game window, from the bottom, hashed to notice new messages
+MESSAGE_AREA = 0.15
+
+# Both scripts run in a subshell: instance.bash shares its session with the
+# model's bash tool, so their exits and variables must not reach it.
+
+# Sends all keys in one xdotool call. Keys go to the focused window, since
+# SDL ignores the synthetic events `xdotool key --window` sends.
+SEND_ALL_SCRIPT = """(
+export DISPLAY=:1
+window=$(xdotool search --name {window} | head -1)
+[ -z "$window" ] && {{ echo "Game window not found" >&2; exit 1; }}
+xdotool windowactivate --sync "$window" key --delay {delay_ms} {keys}
+echo "Sent all {count} keys"
+)"""
+
+# Sends keys one at a time, stopping as soon as the message area changes. The
+# bottom rows of the window are the tail of its xwd dump, so hashing the last
+# bytes of the dump hashes the message area.
+SEND_UNTIL_MESSAGE_SCRIPT = """(
+export DISPLAY=:1
+window=$(xdotool search --name {window} | head -1)
+[ -z "$window" ] && {{ echo "Game window not found" >&2; exit 1; }}
+eval $(xdotool getwindowgeometry --shell "$window")
+area=$((WIDTH * 4 * HEIGHT * {area_percent} / 100))
+messages() {{ xwd -id "$window" -silent | tail -c "$area" | md5sum; }}
+xdotool windowactivate --sync "$window"
+before=$(messages)
+sent=0
+for key in {keys}; do
+    xdotool key "$key"
+    sent=$((sent + 1))
+    sleep {delay_seconds}
+    if [ "$(messages)" != "$before" ]; then
+        echo "Stopped after $sent of {count} keys: a new message appeared"
+        exit 0
+    fi
+done
+echo "Sent all {count} keys, no new messages"
+)"""
+
+
+def _keys_sent(output: str, requested: int) -> int:
+    match = re.search(r"Stopped after (\d+) of", output)
+    return int(match[1]) if match else requested
+
+
+class KeySequenceTool(BaseAnthropicTool):
+    """Sends a sequence of keys to the game in one tool call.
+
+    Walking, resting or working through a menu otherwise costs one model
+    turn per keystroke. The whole sequence runs in a single bash call on the
+    instance, optionally stopping early once a new message shows up, and
+    returns one observation at the end: a screenshot, or just the outcome
+    when the game state is sent as text.
+    """
+
+    name = "key_sequence"
+
+    def __init__(self, instance, screenshot: bool = True):
+        self.instance = instance
+        self.screenshot = screenshot
+        self.calls = 0
+        self.keys_sent = 0
+        super().__init__()
+
+    def to_params(self) -> BetaToolParam:
+        return {
+            "name": self.name,
+            "description": (
+                "Press a sequence of keys in the game window with one call, then "
+                "observe the result once. Use it for repeated moves (e.g. "
+                '["l", "l", "l", "l"]), resting, or known menu sequences. Keys '
+                'are xdotool key names: letters, digits, "Return", "Escape", '
+                '"shift+l", "ctrl+f", "period", "comma", "less", "greater". '
+                "With stop_on_message, the sequence stops as soon as the "
+                "message log changes, e.g. when a monster comes into view."
+            ),
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "keys": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": f"Keys to press in order, at most {MAX_KEYS}",
+                    },
+                    "delay_ms": {
+                        "type": "integer",
+                        "description": "Milliseconds to wait after each key (default 100)",
+                    },
+                    "stop_on_message": {
+                        "type": "boolean",
+                        "description": "Stop early when a new message appears (default true)",
+                    },
+                },
+                "required": ["keys"],
+            },
+        }
+
+    async def __call__(self, **kwargs: Any) -> ToolResult:
+        keys = kwargs.get("keys") or []
+        delay_ms = max(int(kwargs.get("delay_ms", 100)), 0)
+        stop_on_message = kwargs.get("stop_on_message", True)
+        if not keys or len(keys) > MAX_KEYS:
+            raise ToolError(f"keys must be a list of 1 to {MAX_KEYS} keys")
+
+        quoted = " ".join(shlex.quote(str(key)) for key in keys)
+        if stop_on_message:
+            command = SEND_UNTIL_MESSAGE_SCRIPT.format(
+                window=shlex.quote(GAME_WINDOW),
+                keys=quoted,
+                count=len(keys),
+                delay_seconds=delay_ms / 1000,
+                area_percent=round(MESSAGE_AREA * 100),
+            )
+        else:
+            command = SEND_ALL_SCRIPT.format(
+                window=shlex.quote(GAME_WINDOW),
+                keys=quoted,
+                count=len(keys),
+                delay_ms=delay_ms,
+            )
+
+        loop = asyncio.get_event_loop()
+        try:
+            result = await loop.run_in_executor(
+                None, lambda: self.instance.bash(command=command)
+            )
+            screenshot = (
+                await loop.run_in_executor(None, self.instance.screenshot)
+                if self.screenshot
+                else None
+            )
+        except Exception as e:
+            raise ToolError(str(e)) from None
+
+        result = result or {}
+        self.calls += 1
+        self.keys_sent += _keys_sent(result.get("output") or "", len(keys))
+        return ToolResult(
+            output=result.get("output") or None,
+            error=result.get("error") or None,
+            base64_image=screenshot.base_64_image if screenshot else None,
+        )
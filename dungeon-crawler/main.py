@@ -1,10 +1,22 @@
+import argparse
 import asyncio
+import time
 from datetime import datetime
 from typing import Any, cast
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from scrapybara import Scrapybara
 from scrapybara.anthropic import BashTool, ComputerTool, EditTool, ToolResult
 from dotenv import load_dotenv
+from engine import AgentLoop, TurnStats
+from helpers import ToolCollection
+from history import ContextBudget, ScreenshotRetention
+from images import ScreenshotProcessor
+from pool import InstancePool
+from checkpoint import Checkpointer
+from game_state import DUMP_HOOK_CHECK, DUMP_HOOK_COMMAND, StateReaderStats, read_state
+from macro import KeySequenceTool
+from provision import Provisioner, Step, apt_step
+from warmup import App, Warmup, parse_apps
 import os
 
 UBUNTU_UBUNTU_SYSTEM_PROMPT = """<SYSTEM_CAPABILITY>
@@ -58,38 +70,119 @@ Key information:
 - The game is turn-based, so take your time to think
 - You can see your health, mana, and status in the interface
 - Use keyboard commands for movement (yuhjklbn) and actions
+- Use the key_sequence tool to press several keys in one call (walking, resting, menus) instead of one computer key action per keystroke
 - '?' shows help, 'i' for inventory, 'g' to pick up items
 - Read the messages at the bottom of the screen carefully
 - To exit the loop/game, type "quit" or "exit" in a text message response"""
 
 
+TEXT_STATE_PROMPT = """
+
+After every turn, a <game_state> block with your stats, location, inventory, recent messages and the map around you (@) is added to the tool results. Keys and clicks don't return screenshots; rely on the game state, and take a screenshot with the computer tool only when you need to see the screen, e.g. in menus, character creation or when targeting."""
+
+
+# Setup the game needs; skipped on pooled instances that already ran it
+PROVISION_STEPS = [apt_step("crawl-tiles", "crawl-tiles")]
+# With --text-state, the game writes a character dump at every main prompt
+TEXT_STATE_STEPS = [Step("crawl-dump-hook", DUMP_HOOK_COMMAND, check=DUMP_HOOK_CHECK)]
+
+GAME_APP = App("Dungeon Crawl Stone Soup", "/usr/games/crawl-tiles", "--name Crawl")
+
+
+KEEP_PLAYING_PROMPT = "just keep playing the game and don't ask questions. if you want to exit, type 'exit' or 'quit' in a text message response"
+
+
 class GameAgent:
-    def __init__(self, scrapybara_api_key: str, anthropic_api_key: str):
+    def __init__(
+        self,
+        scrapybara_api_key: str,
+        anthropic_api_key: str,
+        keep_screenshots: int | None = 3,
+        screenshot_processor: ScreenshotProcessor | None = None,
+        trace_path: str | None = None,
+        pool_size: int = 0,
+        pool_ttl: float = 15 * 60,
+        context_budget: int | None = 80_000,
+        checkpoint_path: str | None = None,
+        text_state: bool = False,
+        warmup_apps: list[App] | None = None,
+    ):
         self.scrapybara = Scrapybara(api_key=scrapybara_api_key, timeout=600)
-        self.anthropic = Anthropic(api_key=anthropic_api_key)
+        self.anthropic = AsyncAnthropic(api_key=anthropic_api_key)
         self.instance = None
+        self.keep_screenshots = keep_screenshots
+        self.screenshot_processor = screenshot_processor
+        self.trace_path = trace_path
+        self.context_budget = context_budget
+        # With a pool, instances are leased and returned instead of started and stopped
+        self.pool = (
+            InstancePool(self.scrapybara, size=pool_size, ttl=pool_ttl)
+            if pool_size > 0
+            else None
+        )
+        self.checkpointer = Checkpointer(checkpoint_path) if checkpoint_path else None
+        # Set once Claude quits; until then the instance is kept for --resume
+        self.finished = False
+        # Read the game state from character dumps instead of screenshots
+        self.text_state = text_state
+        self.state_stats = StateReaderStats()
+        # When start() began, to report the cold start time to the first prompt
+        self.started_at: float | None = None
+        # Opened together with the game before Claude's first turn
+        self.warmup_apps = warmup_apps or []
 
     def start(self):
         """Start Scrapybara instance and install game"""
         print("Starting Scrapybara instance...")
-        self.instance = self.scrapybara.start(instance_type="large")
+        self.started_at = time.perf_counter()
+        if self.pool:
+            self.instance = self.pool.lease("large")
+            # Start the next run's instance while this one is in use
+            self.pool.fill_in_background("large")
+        else:
+            self.instance = self.scrapybara.start(instance_type="large")
+
+        # Install DCSS, unless this instance already has it
+        steps = PROVISION_STEPS + (TEXT_STATE_STEPS if self.text_state else [])
+        report = Provisioner(steps).run(self.instance)
+        print(report.summary())
+        if not report.ok:
+            raise RuntimeError(
+                f"Setup step {report.steps[-1].name} failed:\n{report.steps[-1].output}"
+            )
 
-        # Install DCSS using bash
-        install_cmd = "sudo apt-get install -y crawl-tiles"
-        self.instance.bash(command=install_cmd)
+    def resume(self, checkpoint_path: str) -> list:
+        """Reattach to the instance of a checkpointed session and return its messages"""
+        checkpoint = Checkpointer(checkpoint_path).load()
+        print(f"Reattaching to instance {checkpoint.instance_id}...")
+        instance = self.scrapybara.get(checkpoint.instance_id)
+        if instance.status != "running":
+            raise RuntimeError(
+                f"Instance {instance.id} from the checkpoint is {instance.status}"
+            )
+        self.instance = instance
+        return checkpoint.messages
 
-    async def play_game(self):
-        """Start the game and let Claude play"""
+    async def play_game(self, messages: list | None = None):
+        """Start the game and let Claude play, or continue a resumed session's messages"""
         print("Starting game session...")
 
-        # Start the game
-        self.instance.bash(command="(DISPLAY=:1 /usr/games/crawl-tiles &)")
+        ready_note = None
+        if messages is None:
+            # Start the game and wait for its window, so Claude's first
+            # screenshot shows the game instead of a desktop still loading
+            report = Warmup([GAME_APP, *self.warmup_apps]).run(self.instance)
+            print(report.summary())
+            ready_note = report.note()
 
         # Setup tools for Claude
+        key_sequence = KeySequenceTool(self.instance, screenshot=not self.text_state)
         tool_collection = ToolCollection(
             ComputerTool(self.instance),
             BashTool(self.instance),
             EditTool(self.instance),
+            key_sequence,
+            processor=self.screenshot_processor,
         )
 
         initial_prompt = """I've started Dungeon Crawl Stone Soup for you. 
@@ -99,138 +192,207 @@ Let's create a character and start playing!
 2. We'll create a beginner-friendly character
 3. Then you can start exploring the dungeon"""
 
-        messages = [
-            {"role": "user", "content": [{"type": "text", "text": initial_prompt}]}
-        ]
-
-        while True:
-            response = self.anthropic.beta.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=4096,
-                messages=messages,
-                system=[{"type": "text", "text": UBUNTU_UBUNTU_SYSTEM_PROMPT}],
-                tools=tool_collection.to_params(),
-                betas=["computer-use-2024-10-22"],
+        if messages is None:
+            content = [{"type": "text", "text": initial_prompt}]
+            if ready_note:
+                content.append({"type": "text", "text": ready_note})
+            messages = [{"role": "user", "content": content}]
+        elif messages[-1]["role"] == "assistant":
+            # Saved after a turn without tool calls, before the nudge was sent
+            messages.append(
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": KEEP_PLAYING_PROMPT}],
+                }
             )
 
-            response_params = [block.model_dump() for block in response.content]
-            tool_result_content = []
-
-            # Check if response contains text that's not an exit command
-            has_non_exit_text = any(
-                block["type"] == "text"
-                and not (
-                    "exit" in block["text"].lower() or "quit" in block["text"].lower()
-                )
-                for block in response_params
+        def should_stop(blocks: list, tool_results: list) -> bool:
+            # Claude exits the game by saying so in a text response
+            return any(
+                "exit" in block["text"].lower() or "quit" in block["text"].lower()
+                for block in blocks
+                if block["type"] == "text"
             )
 
-            # Process each content block in the response
-            for block in response_params:
-                if block["type"] == "text":
-                    print(f"\nClaude: {block['text']}")
-                elif block["type"] == "tool_use":
-                    print(f"\nUsing tool: {block['name']}")
-
-                    result = await tool_collection.run(
-                        name=block["name"], tool_input=block["input"]
-                    )
+        def on_tool(name: str, tool_input: dict) -> None:
+            print(f"\nUsing tool: {name}")
 
-                    if result:
-                        tool_result = {
-                            "type": "tool_result",
-                            "tool_use_id": block["id"],
-                            "content": (
-                                [{"type": "text", "text": result.output}]
-                                if result.output
-                                else []
-                            ),
-                            "is_error": bool(result.error),
-                        }
-
-                        if result.base64_image:
-                            tool_result["content"].append(
-                                {
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": "image/png",
-                                        "data": result.base64_image,
-                                    },
-                                }
-                            )
-
-                        tool_result_content.append(tool_result)
-
-            # Update chat history
-            messages.append({"role": "assistant", "content": response_params})
-
-            if tool_result_content:
-                messages.append({"role": "user", "content": tool_result_content})
-            elif has_non_exit_text:
-                # Add the "keep playing" message if there was non-exit text
-                messages.append(
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "just keep playing the game and don't ask questions. if you want to exit, type 'exit' or 'quit' in a text message response",
-                            }
-                        ],
-                    }
+        def post_process(name: str, tool_input: dict, result: ToolResult) -> ToolResult:
+            # The game state block replaces the screenshot every action returns
+            if (
+                name == "computer"
+                and tool_input.get("action") != "screenshot"
+                and result.base64_image
+            ):
+                return result.replace(
+                    base64_image=None,
+                    output=result.output or "Done, see the game state below.",
                 )
+            return result
 
-            # Check for game over or user interruption
-            if any(
-                "exit" in block["text"].lower() or "quit" in block["text"].lower()
-                for block in response_params
-                if block["type"] == "text"
-            ):
-                break
+        async def on_turn(turn: TurnStats) -> None:
+            print(turn.summary())
+            if self.text_state and messages[-1]["role"] == "user":
+                state = await asyncio.to_thread(
+                    read_state, self.instance, self.state_stats
+                )
+                if state:
+                    messages[-1]["content"].append(
+                        {"type": "text", "text": state.to_text()}
+                    )
+            if self.checkpointer:
+                self.checkpointer.save(messages, self.instance.id)
+
+        loop = AgentLoop(
+            self.anthropic,
+            tool_collection,
+            UBUNTU_UBUNTU_SYSTEM_PROMPT
+            + (TEXT_STATE_PROMPT if self.text_state else ""),
+            retention=ScreenshotRetention(
+                keep_last=self.keep_screenshots, min_removal=5
+            ),
+            context_budget=(
+                ContextBudget(self.context_budget) if self.context_budget else None
+            ),
+            nudge=KEEP_PLAYING_PROMPT,
+            on_text=lambda text: print(f"\nClaude: {text}"),
+            on_tool=on_tool,
+            post_process=post_process if self.text_state else None,
+            should_stop=should_stop,
+            on_turn=on_turn,
+            trace_path=self.trace_path,
+        )
+        if self.started_at is not None:
+            print(
+                f"Cold start to first prompt: {time.perf_counter() - self.started_at:.1f}s"
+            )
+        # Saved before the first turn too, so a game interrupted during it
+        # can still be resumed
+        if self.checkpointer:
+            self.checkpointer.save(messages, self.instance.id)
+        stats = await loop.run(messages)
+        self.finished = True
+        print(stats.summary())
+
+        # For comparing runs with and without --text-state
+        totals = stats.totals()
+        minutes = totals["wall_seconds"] / 60
+        print(
+            f"{totals['turns'] / minutes if minutes else 0:.1f} turns/min, "
+            f"{totals['image_bytes'] // max(totals['turns'], 1) // 1024} KB images per turn"
+        )
+        if key_sequence.calls:
+            print(
+                f"{key_sequence.keys_sent} keys sent in "
+                f"{key_sequence.calls} key_sequence calls"
+            )
+        if self.text_state:
+            print(self.state_stats.summary())
 
     def cleanup(self):
         """Clean up resources"""
-        if self.instance:
+        if self.instance and self.checkpointer and not self.finished:
+            print(
+                f"Leaving instance {self.instance.id} running, continue with "
+                f"--resume {self.checkpointer.path}"
+            )
+        elif self.instance and self.pool:
+            self.pool.release(self.instance)
+        elif self.instance:
             self.instance.stop()
 
 
-class ToolCollection:
-    """Tool collection for Claude"""
-
-    def __init__(self, *tools):
-        self.tools = tools
-        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
-
-    def to_params(self) -> list:
-        return [tool.to_params() for tool in self.tools]
-
-    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
-        tool = self.tool_map.get(name)
-        if not tool:
-            return None
-        try:
-            return await tool(**tool_input)
-        except Exception as e:
-            print(f"Error running tool {name}: {e}")
-            return None
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Let Claude play Dungeon Crawl Stone Soup on a Scrapybara instance"
+    )
+    parser.add_argument(
+        "--tile-diff",
+        action="store_true",
+        help="send only the changed regions of consecutive screenshots",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="append per-turn timing and token stats to this JSONL file",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=0,
+        help="keep this many started instances warm for the next run (default: 0, start and stop one per run)",
+    )
+    parser.add_argument(
+        "--pool-ttl",
+        type=int,
+        default=15,
+        help="minutes a pooled instance may sit idle before it is stopped (default: 15)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="PATH",
+        help="save the conversation to this file after every turn; an interrupted session's instance is left running",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="PATH",
+        help="reattach to the instance saved in this checkpoint and continue the session",
+    )
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=80000,
+        help="summarize the oldest turns once the conversation is estimated to exceed this many tokens, 0 disables (default: 80000)",
+    )
+    parser.add_argument(
+        "--text-state",
+        action="store_true",
+        help="give Claude the game state from character dumps each turn instead of a screenshot after every action",
+    )
+    parser.add_argument(
+        "--warmup",
+        action="append",
+        default=[],
+        metavar="APP",
+        help="also open this GUI app before Claude's first turn: chromium, libreoffice, xterm or NAME=COMMAND; repeatable",
+    )
+    args = parser.parse_args()
+    try:
+        args.warmup = parse_apps(args.warmup)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
 
 
-async def main():
+async def main(args: argparse.Namespace):
 
     load_dotenv(override=True)
 
     agent = GameAgent(
         scrapybara_api_key=os.getenv("SCRAPYBARA_API_KEY"),
         anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"),
+        screenshot_processor=ScreenshotProcessor(
+            format="JPEG", quality=80, dedupe_threshold=4, tile_diff=args.tile_diff
+        ),
+        trace_path=args.trace,
+        pool_size=args.pool_size,
+        pool_ttl=args.pool_ttl * 60,
+        context_budget=args.context_budget,
+        # Resuming keeps checkpointing to the same file unless told otherwise
+        checkpoint_path=args.checkpoint or args.resume,
+        text_state=args.text_state,
+        warmup_apps=args.warmup,
     )
 
     try:
-        agent.start()
-        await agent.play_game()
+        if args.resume:
+            await agent.play_game(agent.resume(args.resume))
+        else:
+            agent.start()
+            await agent.play_game()
     finally:
         agent.cleanup()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,216 @@
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+# Elements that never hold content worth sending to the model
+SKIP_TAGS = {
+    "script",
+    "style",
+    "noscript",
+    "svg",
+    "template",
+    "iframe",
+    "head",
+    "nav",
+    "footer",
+    "button",
+    "select",
+    "form",
+    # LinkedIn ships page data as JSON inside hidden <code> elements
+    "code",
+}
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "aside",
+    "blockquote",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "header",
+    "li",
+    "main",
+    "ol",
+    "p",
+    "section",
+    "table",
+    "tr",
+    "ul",
+}
+
+# (attribute, value) pairs marking the parts of a LinkedIn job page that
+# matter: the title, the company and the description. An element matches
+# when its id equals the value or its class list contains it. Covers the
+# logged in jobs view and the public job page.
+JOB_REGIONS = [
+    ("class", "job-details-jobs-unified-top-card__job-title"),
+    ("class", "job-details-jobs-unified-top-card__company-name"),
+    ("class", "top-card-layout__title"),
+    ("class", "topcard__org-name-link"),
+    ("id", "job-details"),
+    ("class", "jobs-description__content"),
+    ("class", "show-more-less-html__markup"),
+]
+
+
+def estimate_tokens_from_chars(chars: int) -> int:
+    """Rough token count, at about four characters per token."""
+    return chars // 4
+
+
+@dataclass
+class ReductionReport:
+    chars_before: int
+    chars_after: int
+    regions_matched: int
+
+    @property
+    def tokens_before(self) -> int:
+        return estimate_tokens_from_chars(self.chars_before)
+
+    @property
+    def tokens_after(self) -> int:
+        return estimate_tokens_from_chars(self.chars_after)
+
+    def __str__(self) -> str:
+        source = (
+            f"{self.regions_matched} job regions"
+            if self.regions_matched
+            else "whole page, no job regions found"
+        )
+        return (
+            f"Page text: {self.chars_before} -> {self.chars_after} chars, "
+            f"~{self.tokens_before} -> ~{self.tokens_after} tokens ({source})"
+        )
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self, regions: List[Tuple[str, str]]):
+        super().__init__(convert_charrefs=True)
+        self.regions = regions
+        # (tag, skipping, in_region) for every open element
+        self.stack: List[Tuple[str, bool, bool]] = []
+        self.page: List[str] = []
+        self.matched: List[str] = []
+        self.regions_matched = 0
+
+    @property
+    def skipping(self) -> bool:
+        return bool(self.stack) and self.stack[-1][1]
+
+    @property
+    def in_region(self) -> bool:
+        return bool(self.stack) and self.stack[-1][2]
+
+    def matches(self, attrs: list) -> bool:
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        return any(
+            (name == "id" and attrs.get("id") == value)
+            or (name == "class" and value in classes)
+            for name, value in self.regions
+        )
+
+    def emit(self, text: str) -> None:
+        self.page.append(text)
+        if self.in_region:
+            self.matched.append(text)
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag == "br":
+            self.emit("\n")
+        if tag in VOID_TAGS:
+            return
+        skipping = self.skipping or tag in SKIP_TAGS
+        in_region = self.in_region
+        if not skipping and not in_region and self.matches(attrs):
+            in_region = True
+            self.regions_matched += 1
+            self.matched.append("\n\n")
+        self.stack.append((tag, skipping, in_region))
+        if skipping:
+            return
+        if tag in BLOCK_TAGS:
+            self.emit("\n")
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self.emit("#" * int(tag[1]) + " ")
+        elif tag == "li":
+            self.emit("- ")
+
+    def handle_endtag(self, tag: str) -> None:
+        # Browsers tolerate unclosed elements, so close everything up to the
+        # nearest matching open tag and ignore stray end tags
+        if not any(open_tag == tag for open_tag, _, _ in self.stack):
+            return
+        while self.stack:
+            open_tag, skipping, _ = self.stack[-1]
+            if not skipping and open_tag in BLOCK_TAGS:
+                self.emit("\n")
+            self.stack.pop()
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data: str) -> None:
+        if not self.skipping:
+            self.emit(data)
+
+
+def collapse_whitespace(text: str) -> str:
+    lines = [re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in text.split("\n")]
+    text = "\n".join(lines)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def html_to_text(
+    html: str,
+    regions: Optional[List[Tuple[str, str]]] = JOB_REGIONS,
+    max_chars: Optional[int] = 20000,
+) -> Tuple[str, ReductionReport]:
+    """Compact markdown-like text of a page, keeping only `regions` when any are found.
+
+    Scripts, styles and other non-content elements are dropped, headings and
+    list items are marked up and whitespace is collapsed. When none of the
+    regions are on the page the whole page's text is used, cut to `max_chars`.
+    """
+    parser = _TextExtractor(regions or [])
+    parser.feed(html)
+    parser.close()
+
+    parts = parser.matched if parser.regions_matched else parser.page
+    text = collapse_whitespace("".join(parts))
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars] + "\n... (truncated)"
+    return text, ReductionReport(len(html), len(text), parser.regions_matched)
+
+
+if __name__ == "__main__":
+    # Measure the reduction on saved pages: python html_text.py page.html ...
+    import sys
+
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            _, report = html_to_text(f.read())
+        print(f"{path}: {report}")
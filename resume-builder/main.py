@@ -1,89 +1,235 @@
+import argparse
 import asyncio
+import re
+import time
 from playwright.async_api import async_playwright
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from scrapybara import Scrapybara
 from dotenv import load_dotenv
+from html_text import html_to_text
+from readiness import load_page
 import os
 
-async def main():
+SEARCH_URL = "https://www.linkedin.com/jobs/search/?keywords=software%20engineer"
+
+PROMPT = """Analyze this job posting from LinkedIn and create a professional resume in LaTeX format that's tailored to the position.
+        Focus on relevant technical skills and experience that match the job requirements.
+        The resume should be well-structured with clear sections for:
+        - Contact Information
+        - Professional Summary
+        - Technical Skills
+        - Work Experience
+        - Education
+        Make it ATS-friendly and emphasize matching qualifications.
+        Include proper LaTeX headers and document structure.
+
+        Here's the job posting content:
+        {content}
+
+        Please provide the resume in LaTeX format. Return the LaTeX content only. No other text."""
+
+
+def job_id(url: str) -> str | None:
+    match = re.search(r"/jobs/view/(\d+)|currentJobId=(\d+)", url)
+    return next(group for group in match.groups() if group) if match else None
+
+
+async def fetch_posting(context, url: str, scroll: bool = False) -> str:
+    """Open a job posting on its own page and return its compact text.
+
+    A posting's description is near the top, so there is no need to scroll
+    for lazy content; pass `scroll` for a search result page.
+    """
+    page = await context.new_page()
+    try:
+        readiness = await load_page(
+            page, url, max_seconds=20 if scroll else 15, scroll=scroll
+        )
+
+        # Get page content, reduced to the job posting's text
+        content, report = html_to_text(await page.content())
+        print(f"{url}\n  {readiness}\n  {report}")
+        return content
+    finally:
+        await page.close()
+
+
+async def search_job_urls(context, search_url: str, limit: int) -> list[str]:
+    """Collect up to `limit` job posting URLs from a search result list."""
+    page = await context.new_page()
+    try:
+        # Scroll through the result list so more of its cards load
+        print(await load_page(page, search_url, max_seconds=20))
+        hrefs = await page.eval_on_selector_all(
+            'a[href*="/jobs/view/"]', "links => links.map(link => link.href)"
+        )
+    finally:
+        await page.close()
+
+    urls = []
+    for href in hrefs:
+        posting_id = job_id(href)
+        url = f"https://www.linkedin.com/jobs/view/{posting_id}/"
+        if posting_id and url not in urls:
+            urls.append(url)
+    return urls[:limit]
+
+
+def extract_latex(message: str) -> str:
+    latex_start = message.find("```latex")
+    latex_end = message.rfind("```")
+    if latex_start != -1 and latex_end != -1:
+        return message[latex_start + 8:latex_end].strip()
+    return message  # Fallback if no latex code block found
+
+
+async def generate_resume(anthropic: AsyncAnthropic, content: str) -> str:
+    response = await anthropic.messages.create(
+        model="claude-3-5-sonnet-20241022",
+        max_tokens=4000,
+        temperature=0.7,
+        messages=[{"role": "user", "content": PROMPT.format(content=content)}]
+    )
+    return extract_latex(response.content[0].text)
+
+
+async def build_resumes(
+    context,
+    anthropic: AsyncAnthropic,
+    urls: list[str],
+    out_dir: str,
+    pages: int,
+    concurrency: int,
+) -> int:
+    """Fetch postings on up to `pages` tabs at once and generate up to `concurrency`
+    resumes at once, writing one .tex per job. Returns how many were written."""
+    page_slots = asyncio.Semaphore(pages)
+    generation_slots = asyncio.Semaphore(concurrency)
+    os.makedirs(out_dir, exist_ok=True)
+
+    async def build(i: int, url: str) -> bool:
+        try:
+            async with page_slots:
+                content = await fetch_posting(context, url)
+            async with generation_slots:
+                latex = await generate_resume(anthropic, content)
+        except Exception as e:
+            print(f"Failed to build a resume for {url}: {e}")
+            return False
+        path = os.path.join(out_dir, f"resume-{job_id(url) or i + 1}.tex")
+        with open(path, "w") as f:
+            f.write(latex)
+        print(f"Saved {path}")
+        return True
+
+    results = await asyncio.gather(*(build(i, url) for i, url in enumerate(urls)))
+    return sum(results)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate resumes tailored to LinkedIn job postings"
+    )
+    parser.add_argument(
+        "--urls",
+        metavar="FILE",
+        help="build one resume per job posting URL in this file (one per line)",
+    )
+    parser.add_argument(
+        "--search",
+        metavar="URL",
+        help="build one resume per job in this LinkedIn search's result list",
+    )
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=10,
+        help="most jobs to take from --search (default: 10)",
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=4,
+        help="job postings to load at once, each on its own page (default: 4)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=3,
+        help="resumes to generate with Claude at once (default: 3)",
+    )
+    parser.add_argument(
+        "--out-dir",
+        default="resumes",
+        help="directory batch mode writes the .tex files to (default: resumes)",
+    )
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace):
     # Load environment variables
     load_dotenv()
-    
+
     # Initialize clients
     scrapybara = Scrapybara(api_key=os.getenv("SCRAPYBARA_API_KEY"))
-    anthropic = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    
+    anthropic = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
     print("Starting Scrapybara instance...")
     instance = scrapybara.start(instance_type="small")
-    
+
     try:
         # Start browser and get CDP URL
         print("Starting browser...")
         cdp_url = instance.browser.start().cdp_url
-        
+
         # Load authentication state
         instance.browser.authenticate(auth_state_id=os.getenv("AUTH_STATE_ID"))
-        
-        # Connect with Playwright
+
+        # Connect with Playwright; every page in the batch shares this connection
         async with async_playwright() as playwright:
             browser = await playwright.chromium.connect_over_cdp(cdp_url)
-            page = await browser.new_page()
-            
-            # Navigate to LinkedIn jobs
-            print("Navigating to LinkedIn jobs...")
-            await page.goto("https://www.linkedin.com/jobs/search/?keywords=software%20engineer")
-            await page.wait_for_timeout(5000)  # Wait 5 seconds
-            
-            # Get page content
-            content = await page.content()
-            
+            # Pages share the browser's default context, which holds the LinkedIn session
+            context = browser.contexts[0] if browser.contexts else await browser.new_context()
+
+            if not (args.urls or args.search):
+                # Navigate to LinkedIn jobs
+                print("Navigating to LinkedIn jobs...")
+                # Scroll the result list so more of its cards load
+                content = await fetch_posting(context, SEARCH_URL, scroll=True)
+
+                # Get resume from Claude
+                print("Generating resume with Claude...")
+                latex_content = await generate_resume(anthropic, content)
+
+                # Save LaTeX
+                with open("tailored_resume.tex", "w") as f:
+                    f.write(latex_content)
+                print("Resume saved as LaTeX")
+            else:
+                if args.urls:
+                    with open(args.urls) as f:
+                        urls = [line.strip() for line in f if line.strip()]
+                else:
+                    urls = await search_job_urls(context, args.search, args.max_jobs)
+                print(f"Building resumes for {len(urls)} jobs...")
+
+                started = time.perf_counter()
+                built = await build_resumes(
+                    context, anthropic, urls, args.out_dir, args.pages, args.concurrency
+                )
+                minutes = (time.perf_counter() - started) / 60
+                print(
+                    f"Built {built} of {len(urls)} resumes in {minutes:.1f} min "
+                    f"({built / minutes if minutes else 0:.1f} resumes/min)"
+                )
+
             # Close browser connection
             await browser.close()
-        
-        # Prepare prompt for Claude
-        prompt = f"""Analyze this job posting from LinkedIn and create a professional resume in LaTeX format that's tailored to the position. 
-        Focus on relevant technical skills and experience that match the job requirements.
-        The resume should be well-structured with clear sections for:
-        - Contact Information
-        - Professional Summary
-        - Technical Skills
-        - Work Experience
-        - Education
-        Make it ATS-friendly and emphasize matching qualifications.
-        Include proper LaTeX headers and document structure.
-        
-        Here's the job posting content:
-        {content}
-        
-        Please provide the resume in LaTeX format. Return the LaTeX content only. No other text."""
-        
-        # Get resume from Claude
-        print("Generating resume with Claude...")
-        response = anthropic.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=4000,
-            temperature=0.7,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        # Extract LaTeX content
-        message = response.content[0].text
-        latex_start = message.find("```latex")
-        latex_end = message.rfind("```")
-        if latex_start != -1 and latex_end != -1:
-            latex_content = message[latex_start + 8:latex_end].strip()
-        else:
-            latex_content = message  # Fallback if no latex code block found
-            
-        # Save LaTeX
-        with open("tailored_resume.tex", "w") as f:
-            f.write(latex_content)
-        print("Resume saved as LaTeX")
-        
+
     finally:
         # Cleanup
         instance.stop()
         print("Instance stopped")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
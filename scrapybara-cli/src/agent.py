@@ -1,74 +1,103 @@
 from .prompt import UBUNTU_UBUNTU_SYSTEM_PROMPT
-from .helpers import ToolCollection, make_tool_result
+from .helpers import ToolCollection
+from .history import ContextBudget, ScreenshotRetention
+from .engine import AgentLoop, RunStats, TurnStats
+from .checkpoint import Checkpointer
 from scrapybara.client import Instance
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from rich import print
+from rich.console import Console
+from typing import Optional
 
+console = Console()
 
-async def run_agent(instance: Instance, tools: ToolCollection, prompt: str) -> None:
-    anthropic = Anthropic()
 
-    stream_url = instance.get_stream_url().stream_url
-
-    messages = []
-    messages.append({"role": "user", "content": [{"type": "text", "text": prompt}]})
+def describe_tool_use(name: str, tool_input: dict, stream_url: str) -> str:
+    text = f"Running {name} with {tool_input}"
 
-    while True:
-        # Get Claude's response
-        response = anthropic.beta.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=4096,
-            messages=messages,
-            system=[{"type": "text", "text": UBUNTU_UBUNTU_SYSTEM_PROMPT}],
-            tools=tools.to_params(),
-            betas=["computer-use-2024-10-22"],
-        )
+    if name == "computer":
+        if tool_input["action"] == "screenshot":
+            text = "[bold yellow]Taking screenshot[/bold yellow]"
+        elif (
+            tool_input["action"] == "left_click"
+            or tool_input["action"] == "right_click"
+        ):
+            text = "[bold yellow]Clicking[/bold yellow]"
+        elif tool_input["action"] == "type":
+            text = "[bold yellow]Typing[/bold yellow]"
+        elif tool_input["action"] == "scroll":
+            text = "[bold yellow]Scrolling[/bold yellow]"
+        elif tool_input["action"] == "key":
+            text = f"[bold yellow]Pressing key '{tool_input['text'].upper()}'[/bold yellow]"
+        elif tool_input["action"] == "mouse_move":
+            text = "[bold yellow]Moving mouse[/bold yellow]"
 
-        # Process tool usage
-        tool_results = []
-        for content in response.content:
-            if content.type == "text":
-                print(f"\n{content.text}")
-            elif content.type == "tool_use":
-                text = f"Running {content.name} with {content.input}"
+    if name == "bash":
+        text = f"[green]scrapybara[/green]@[white]{stream_url.replace('http://', '').split(':')[0]}[/white]# {tool_input['command']}"
 
-                if content.name == "computer":
-                    if content.input["action"] == "screenshot":  # type: ignore
-                        text = "[bold yellow]Taking screenshot[/bold yellow]"
-                    elif content.input["action"] == "left_click" or content.input["action"] == "right_click":  # type: ignore
-                        text = "[bold yellow]Clicking[/bold yellow]"
-                    elif content.input["action"] == "type":  # type: ignore
-                        text = "[bold yellow]Typing[/bold yellow]"
-                    elif content.input["action"] == "scroll":  # type: ignore
-                        text = "[bold yellow]Scrolling[/bold yellow]"
-                    elif content.input["action"] == "key":  # type: ignore
-                        text = f"[bold yellow]Pressing key '{content.input['text'].upper()}'[/bold yellow]"  # type: ignore
-                    elif content.input["action"] == "mouse_move":  # type: ignore
-                        text = "[bold yellow]Moving mouse[/bold yellow]"
+    return text
 
-                if content.name == "bash":
-                    text = f"[green]scrapybara[/green]@[white]{stream_url.replace('http://', '').split(':')[0]}[/white]# {content.input['command']}"  # type: ignore
 
-                print(f"{text}")
+async def run_agent(
+    anthropic: AsyncAnthropic,
+    instance: Instance,
+    tools: ToolCollection,
+    prompt: Optional[str],
+    keep_screenshots: Optional[int] = 3,
+    trace_path: Optional[str] = None,
+    checkpointer: Optional[Checkpointer] = None,
+    messages: Optional[list] = None,
+    context_budget: Optional[int] = None,
+    context: Optional[str] = None,
+) -> RunStats:
+    """Run one task. Pass the `messages` of a checkpoint to continue it instead of starting fresh.
 
-                result = await tools.run(
-                    name=content.name, tool_input=content.input  # type: ignore
-                )
+    `context` is sent as its own text block ahead of the prompt, e.g. which apps are already open.
+    """
+    stream_url = instance.get_stream_url().stream_url
+    messages = [] if messages is None else messages
+    # The tools are shared by every task of the session, but a task starts
+    # without the previous one's screenshots, so its first one goes out in full
+    tools.processor.reset()
+    if prompt:
+        content = [{"type": "text", "text": prompt}]
+        if context:
+            content.insert(0, {"type": "text", "text": context})
+        messages.append({"role": "user", "content": content})
 
-                tool_result = make_tool_result(result, content.id)
-                tool_results.append(tool_result)
+    def on_tool_result(name: str, tool_input: dict, result) -> None:
+        if result.output:
+            print(f"[green]{result.output}[/green]")
+        if result.error:
+            print(f"[red]{result.error}[/red]")
 
-                if result.output:
-                    print(f"[green]{result.output}[/green]")
-                if result.error:
-                    print(f"[red]{result.error}[/red]")
+    def on_turn(turn: TurnStats) -> None:
+        print(f"[dim]{turn.summary()}[/dim]")
+        if checkpointer:
+            checkpointer.save(messages, instance.id)
 
-        # Add assistant's response and tool results to messages
-        messages.append(
-            {"role": "assistant", "content": [c.model_dump() for c in response.content]}
-        )
+    loop = AgentLoop(
+        anthropic,
+        tools,
+        UBUNTU_UBUNTU_SYSTEM_PROMPT,
+        retention=ScreenshotRetention(keep_last=keep_screenshots, min_removal=5),
+        context_budget=ContextBudget(context_budget) if context_budget else None,
+        on_text_delta=lambda text: console.print(
+            text, end="", markup=False, highlight=False
+        ),
+        on_text=lambda text: console.print(),
+        on_tool=lambda name, tool_input: print(
+            describe_tool_use(name, tool_input, stream_url)
+        ),
+        on_tool_result=on_tool_result,
+        on_turn=on_turn,
+        trace_path=trace_path,
+    )
 
-        if tool_results:
-            messages.append({"role": "user", "content": tool_results})
-        else:
-            break
+    # Saved before the first turn too, so a task interrupted during it can
+    # still be resumed
+    if checkpointer:
+        checkpointer.save(messages, instance.id)
+    stats = await loop.run(messages)
+    print(f"[dim]{stats.summary()}[/dim]")
+    return stats
@@ -0,0 +1,136 @@
+import copy
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+class BlobStore:
+    """Content-addressed files, so a frame that shows up many times is stored once."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: str) -> str:
+        digest = hashlib.sha256(data.encode()).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> str:
+        with open(self.path(digest)) as f:
+            return f.read()
+
+
+def _map_images(messages: list, convert) -> list:
+    """Copy of `messages` with `convert` applied to every image source, including inside tool results."""
+    messages = copy.deepcopy(messages)
+    for message in messages:
+        if not isinstance(message["content"], list):
+            continue
+        for block in message["content"]:
+            items = [block]
+            if block.get("type") == "tool_result" and isinstance(
+                block.get("content"), list
+            ):
+                items += block["content"]
+            for item in items:
+                if item.get("type") == "image":
+                    item["source"] = convert(item["source"])
+    return messages
+
+
+def externalize_images(messages: list, store: BlobStore) -> list:
+    """Replace base64 image data with references into `store`."""
+    return _map_images(
+        messages,
+        lambda source: (
+            {
+                "type": "blob",
+                "media_type": source["media_type"],
+                "digest": store.put(source["data"]),
+            }
+            if source.get("type") == "base64"
+            else source
+        ),
+    )
+
+
+def internalize_images(messages: list, store: BlobStore) -> list:
+    """Inverse of `externalize_images`."""
+    return _map_images(
+        messages,
+        lambda source: (
+            {
+                "type": "base64",
+                "media_type": source["media_type"],
+                "data": store.get(source["digest"]),
+            }
+            if source.get("type") == "blob"
+            else source
+        ),
+    )
+
+
+@dataclass
+class Checkpoint:
+    messages: list
+    instance_id: str
+    saved_at: float = 0.0
+    # Anything else the caller needs to pick up where it left off
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def in_progress(self) -> bool:
+        """Whether the conversation stopped waiting on Claude, rather than on the user."""
+        return bool(self.messages) and self.messages[-1]["role"] == "user"
+
+
+class Checkpointer:
+    """Saves the conversation to `path` as JSON, with images in a blob store.
+
+    Blobs go to a `blobs` directory next to the checkpoint so checkpoints in
+    the same directory share them. Writes are atomic, so a crash mid-save
+    leaves the previous checkpoint intact.
+    """
+
+    def __init__(self, path: str, blob_dir: Optional[str] = None):
+        self.path = path
+        self.store = BlobStore(
+            blob_dir or os.path.join(os.path.dirname(os.path.abspath(path)), "blobs")
+        )
+
+    def save(
+        self, messages: list, instance_id: str, extra: Optional[dict] = None
+    ) -> None:
+        checkpoint = {
+            "instance_id": instance_id,
+            "saved_at": time.time(),
+            "extra": extra or {},
+            "messages": externalize_images(messages, self.store),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> Checkpoint:
+        with open(self.path) as f:
+            checkpoint = json.load(f)
+        return Checkpoint(
+            messages=internalize_images(checkpoint["messages"], self.store),
+            instance_id=checkpoint["instance_id"],
+            saved_at=checkpoint["saved_at"],
+            extra=checkpoint.get("extra", {}),
+        )
@@ -0,0 +1,385 @@
+import inspect
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+from anthropic import AsyncAnthropic
+from scrapybara.anthropic.base import ToolFailure
+from .helpers import ToolCollection, make_tool_result
+from .history import (
+    PROMPT_CACHING_BETA,
+    SUMMARIZE_PROMPT,
+    ContextBudget,
+    ScreenshotRetention,
+    cached_system,
+    cached_tools,
+    mark_cache_breakpoints,
+    transcript,
+)
+
+MODEL = "claude-3-5-sonnet-20241022"
+COMPUTER_USE_BETA = "computer-use-2024-10-22"
+
+
+@dataclass
+class TurnStats:
+    """Where the time and tokens of one model turn went."""
+
+    turn: int
+    wall_seconds: float = 0.0
+    model_seconds: float = 0.0
+    first_token_seconds: Optional[float] = None
+    tool_seconds: dict = field(default_factory=dict)
+    tool_calls: int = 0
+    # Why the response ended, e.g. "tool_use", "end_turn" or "max_tokens"
+    stop_reason: Optional[str] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    image_bytes: int = 0
+    # Screenshots left out of this request by the retention policy, and the
+    # base64 bytes and estimated tokens that saves
+    screenshots_evicted: int = 0
+    screenshot_bytes_saved: int = 0
+    screenshot_tokens_saved: int = 0
+    # Old messages replaced with a summary before this request
+    messages_summarized: int = 0
+    summary_seconds: float = 0.0
+
+    def summary(self) -> str:
+        tools = ", ".join(
+            f"{name} {seconds:.1f}s" for name, seconds in self.tool_seconds.items()
+        )
+        first_token = (
+            f", first token {self.first_token_seconds:.1f}s"
+            if self.first_token_seconds is not None
+            else ""
+        )
+        return (
+            f"Turn {self.turn}: {self.wall_seconds:.1f}s "
+            f"(model {self.model_seconds:.1f}s{first_token}"
+            f"{', ' + tools if tools else ''}), "
+            f"{self.input_tokens + self.cache_read_tokens + self.cache_write_tokens} in "
+            f"({self.cache_read_tokens} cached), {self.output_tokens} out, "
+            f"{self.image_bytes // 1024} KB images"
+            + (
+                f", {self.screenshots_evicted} old screenshots omitted "
+                f"({self.screenshot_bytes_saved // 1024} KB, "
+                f"~{self.screenshot_tokens_saved} tokens saved)"
+                if self.screenshots_evicted
+                else ""
+            )
+            + (
+                f", {self.messages_summarized} old messages summarized "
+                f"in {self.summary_seconds:.1f}s"
+                if self.messages_summarized
+                else ""
+            )
+        )
+
+
+@dataclass
+class RunStats:
+    turns: list = field(default_factory=list)
+
+    def totals(self) -> dict:
+        tool_seconds = {}
+        for turn in self.turns:
+            for name, seconds in turn.tool_seconds.items():
+                tool_seconds[name] = tool_seconds.get(name, 0.0) + seconds
+        totals = {"turns": len(self.turns), "tool_seconds": tool_seconds}
+        for key in (
+            "wall_seconds",
+            "model_seconds",
+            "tool_calls",
+            "input_tokens",
+            "output_tokens",
+            "cache_read_tokens",
+            "cache_write_tokens",
+            "image_bytes",
+        ):
+            totals[key] = sum(getattr(turn, key) for turn in self.turns)
+        return totals
+
+    def summary(self) -> str:
+        totals = self.totals()
+        tools = ", ".join(
+            f"{name} {seconds:.1f}s" for name, seconds in totals["tool_seconds"].items()
+        )
+        return (
+            f"{totals['turns']} turns in {totals['wall_seconds']:.1f}s: "
+            f"model {totals['model_seconds']:.1f}s"
+            f"{', ' + tools if tools else ''}; "
+            f"{totals['input_tokens'] + totals['cache_read_tokens'] + totals['cache_write_tokens']} tokens in "
+            f"({totals['cache_read_tokens']} cached), {totals['output_tokens']} out, "
+            f"{totals['image_bytes'] // 1024} KB images"
+        )
+
+
+async def _call(hook: Optional[Callable], *args):
+    """Call an optional hook that may be sync or async."""
+    if hook is None:
+        return None
+    value = hook(*args)
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+def _image_bytes(content) -> int:
+    if not isinstance(content, list):
+        return 0
+    return sum(
+        len(item["source"]["data"]) for item in content if item.get("type") == "image"
+    )
+
+
+class AgentLoop:
+    """The create message -> run tools -> append results loop shared by the agents.
+
+    Responses are streamed; each tool call is dispatched as soon as its block
+    is complete (see ToolBatch). The system prompt, tools and latest turns are
+    marked for prompt caching and old screenshots are evicted by `retention`.
+    With a `context_budget`, the oldest turns are summarized by the model once
+    the history grows past it, so requests stop growing with session length.
+
+    Hooks, all optional and either sync or async:
+      on_text_delta(text): streamed text as it arrives
+      on_text(text): each complete text block
+      on_tool(name, tool_input): a tool call was dispatched
+      post_process(name, tool_input, result) -> ToolResult: rewrite a result
+        before it is sent back
+      on_tool_result(name, tool_input, result): a (post-processed) result
+      should_stop(blocks, tool_results) -> bool: checked after every turn,
+        by default the loop stops once Claude makes no tool calls
+      on_turn(stats): a turn finished
+
+    When Claude makes no tool calls but `should_stop` says to go on, `nudge`
+    is sent as the next user message (without one the loop stops).
+
+    Every turn is recorded as TurnStats in `stats` and, with `trace_path`,
+    appended to that file as a JSON line.
+    """
+
+    def __init__(
+        self,
+        client: AsyncAnthropic,
+        tools: ToolCollection,
+        system: str,
+        *,
+        model: str = MODEL,
+        max_tokens: int = 4096,
+        retention: Optional[ScreenshotRetention] = None,
+        context_budget: Optional[ContextBudget] = None,
+        nudge: Optional[str] = None,
+        on_text_delta: Optional[Callable] = None,
+        on_text: Optional[Callable] = None,
+        on_tool: Optional[Callable] = None,
+        post_process: Optional[Callable] = None,
+        on_tool_result: Optional[Callable] = None,
+        should_stop: Optional[Callable] = None,
+        on_turn: Optional[Callable] = None,
+        trace_path: Optional[str] = None,
+    ):
+        self.client = client
+        self.tools = tools
+        self.system = system
+        self.model = model
+        self.max_tokens = max_tokens
+        self.retention = retention
+        self.context_budget = context_budget
+        self.nudge = nudge
+        self.on_text_delta = on_text_delta
+        self.on_text = on_text
+        self.on_tool = on_tool
+        self.post_process = post_process
+        self.on_tool_result = on_tool_result
+        self.should_stop = should_stop or (
+            lambda blocks, tool_results: not tool_results
+        )
+        self.on_turn = on_turn
+        self.trace_path = trace_path
+        self.stats = RunStats()
+
+    async def run(self, messages: list) -> RunStats:
+        """Run the loop on `messages` (extended in place) until it stops."""
+        # Screenshots from an earlier conversation are not in this one
+        self.tools.processor.reset()
+        system = cached_system(self.system)
+        tool_params = cached_tools(self.tools.to_params())
+
+        while True:
+            turn = TurnStats(turn=len(self.stats.turns) + 1)
+            started = time.perf_counter()
+
+            if self.retention:
+                retained = self.retention.apply(messages)
+                turn.screenshots_evicted = retained.evicted
+                turn.screenshot_bytes_saved = retained.bytes_saved
+                turn.screenshot_tokens_saved = retained.tokens_saved
+            if self.context_budget:
+                await self.compact(messages, turn)
+            mark_cache_breakpoints(messages)
+
+            blocks, tool_results = await self.step(messages, system, tool_params, turn)
+
+            messages.append({"role": "assistant", "content": blocks})
+            if tool_results:
+                messages.append({"role": "user", "content": tool_results})
+
+            turn.wall_seconds = time.perf_counter() - started
+            self.record(turn)
+            await _call(self.on_turn, turn)
+
+            if await _call(self.should_stop, blocks, tool_results):
+                break
+            if not tool_results:
+                if not self.nudge:
+                    break
+                messages.append(
+                    {"role": "user", "content": [{"type": "text", "text": self.nudge}]}
+                )
+
+        return self.stats
+
+    async def step(
+        self, messages: list, system: list, tool_params: list, turn: TurnStats
+    ) -> tuple:
+        """Stream one response and run its tool calls, returning (blocks, tool_results)."""
+        requested = time.perf_counter()
+        stream = await self.client.beta.messages.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            messages=messages,
+            system=system,
+            tools=tool_params,
+            betas=[COMPUTER_USE_BETA, PROMPT_CACHING_BETA],
+            stream=True,
+        )
+
+        blocks = {}
+        partial_json = {}
+        tool_uses = []
+        # Ids of tool calls whose input was cut off, which are not run
+        cut_off = set()
+        batch = self.tools.batch()
+        try:
+            async for event in stream:
+                if event.type == "message_start":
+                    usage = event.message.usage
+                    turn.input_tokens = usage.input_tokens
+                    turn.cache_read_tokens = usage.cache_read_input_tokens or 0
+                    turn.cache_write_tokens = usage.cache_creation_input_tokens or 0
+                elif event.type == "message_delta":
+                    turn.output_tokens = event.usage.output_tokens
+                    turn.stop_reason = event.delta.stop_reason
+                elif event.type == "content_block_start":
+                    if turn.first_token_seconds is None:
+                        turn.first_token_seconds = time.perf_counter() - requested
+                    if event.content_block.type == "text":
+                        blocks[event.index] = {"type": "text", "text": ""}
+                    elif event.content_block.type == "tool_use":
+                        blocks[event.index] = {
+                            "type": "tool_use",
+                            "id": event.content_block.id,
+                            "name": event.content_block.name,
+                            "input": {},
+                        }
+                        partial_json[event.index] = ""
+                elif event.type == "content_block_delta":
+                    # Blocks of other types (e.g. thinking) were never
+                    # registered above and are left out
+                    if event.index not in blocks:
+                        continue
+                    if event.delta.type == "text_delta":
+                        blocks[event.index]["text"] += event.delta.text
+                        await _call(self.on_text_delta, event.delta.text)
+                    elif event.delta.type == "input_json_delta":
+                        partial_json[event.index] += event.delta.partial_json
+                elif event.type == "content_block_stop":
+                    block = blocks.get(event.index)
+                    if block is None:
+                        continue
+                    if block["type"] == "text":
+                        await _call(self.on_text, block["text"])
+                    elif block["type"] == "tool_use":
+                        tool_uses.append(block)
+                        try:
+                            block["input"] = json.loads(
+                                partial_json[event.index] or "{}"
+                            )
+                        except json.JSONDecodeError:
+                            # The response ended partway through the call,
+                            # usually at max_tokens; Claude is told instead
+                            cut_off.add(block["id"])
+                            continue
+                        await _call(self.on_tool, block["name"], block["input"])
+                        batch.submit(block["name"], block["input"])
+            turn.model_seconds = time.perf_counter() - requested
+
+            # Collect tool results in the order Claude requested them
+            tool_results = []
+            results = iter(await batch.results())
+            for block in tool_uses:
+                if block["id"] in cut_off:
+                    result = ToolFailure(
+                        error=f"The input of this {block['name']} call was cut off "
+                        f"(stop reason: {turn.stop_reason}), so it was not run. "
+                        "Make the call again with shorter input."
+                    )
+                else:
+                    result = next(results)
+                if self.post_process and block["id"] not in cut_off:
+                    result = await _call(
+                        self.post_process, block["name"], block["input"], result
+                    )
+                await _call(self.on_tool_result, block["name"], block["input"], result)
+
+                tool_result = make_tool_result(
+                    result, block["id"], self.tools.processor
+                )
+                turn.image_bytes += _image_bytes(tool_result["content"])
+                tool_results.append(tool_result)
+        finally:
+            batch.cancel()
+
+        turn.tool_calls = len(tool_uses)
+        for name, seconds in batch.timings:
+            turn.tool_seconds[name] = turn.tool_seconds.get(name, 0.0) + seconds
+
+        return [blocks[i] for i in sorted(blocks)], tool_results
+
+    async def compact(self, messages: list, turn: TurnStats) -> None:
+        """Summarize the oldest turns if the history is over the context budget."""
+        cut = self.context_budget.find_cut(messages)
+        if cut is None:
+            return
+        started = time.perf_counter()
+        response = await self.client.beta.messages.create(
+            model=self.model,
+            max_tokens=1024,
+            messages=[
+                {
+                    "role": "user",
+                    "content": SUMMARIZE_PROMPT.format(
+                        transcript=transcript(messages[:cut])
+                    ),
+                }
+            ],
+        )
+        summary = "".join(
+            block.text for block in response.content if block.type == "text"
+        )
+        self.context_budget.compact(messages, cut, summary)
+        # The summary may have dropped the frame later dedupe notes and
+        # tile diffs build on, so the next screenshot goes out in full
+        self.tools.processor.reset()
+        turn.messages_summarized = cut - 1
+        turn.summary_seconds = time.perf_counter() - started
+
+    def record(self, turn: TurnStats) -> None:
+        self.stats.turns.append(turn)
+        if self.trace_path:
+            with open(self.trace_path, "a") as f:
+                f.write(json.dumps(asdict(turn)) + "\n")
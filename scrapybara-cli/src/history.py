@@ -0,0 +1,273 @@
+import base64
+import io
+import json
+import struct
+from dataclasses import dataclass
+from typing import Optional
+from PIL import Image
+from .images import PARTIAL_FRAME_TEXT
+
+SCREENSHOT_PLACEHOLDER = "[older screenshot removed to save context]"
+CACHE_CONTROL = {"type": "ephemeral"}
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+SUMMARY_PREFIX = (
+    "Summary of the conversation so far, older turns were removed to save context:"
+)
+SUMMARIZE_PROMPT = """Summarize the conversation below for yourself, so you can carry on with the task without it. Keep what was done, what was learned (facts, file paths, URLs, positions on screen, game state), what failed, and what is left to do. Be concise.
+
+<conversation>
+{transcript}
+</conversation>"""
+
+
+@dataclass
+class RetentionStats:
+    """Result of applying a retention policy to the message history."""
+
+    kept: int = 0
+    evicted: int = 0
+    bytes_saved: int = 0
+    tokens_saved: int = 0
+
+
+def estimate_image_tokens(data: str) -> int:
+    """Estimate the tokens Claude charges for a base64 encoded image."""
+    header = base64.b64decode(data[:32] + "=" * (-len(data[:32]) % 4))
+    if header[:8] == b"\x89PNG\r\n\x1a\n" and header[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", header[16:24])
+    else:
+        # JPEG/WebP keep their size further in, let Pillow read the header
+        width, height = Image.open(io.BytesIO(base64.b64decode(data))).size
+    return (width * height) // 750
+
+
+def _tool_result_frames(messages: list) -> list:
+    """Content lists of the tool results holding screenshots, oldest first.
+
+    A tile-diff frame is one tool result with several image crops, so frames
+    are counted per result rather than per image.
+    """
+    frames = []
+    for message in messages:
+        if message["role"] != "user" or not isinstance(message["content"], list):
+            continue
+        for block in message["content"]:
+            if block.get("type") != "tool_result" or not isinstance(
+                block.get("content"), list
+            ):
+                continue
+            if any(item.get("type") == "image" for item in block["content"]):
+                frames.append(block["content"])
+    return frames
+
+
+def _is_partial(frame: list) -> bool:
+    return any(
+        item.get("type") == "text" and item["text"].startswith(PARTIAL_FRAME_TEXT)
+        for item in frame
+    )
+
+
+class ScreenshotRetention:
+    """Keeps only the last `keep_last` screenshots returned by tools.
+
+    Older screenshots are replaced in place with a short text placeholder.
+    Images the user attached directly (e.g. a reference screenshot) are never
+    touched. `keep_last=None` disables eviction.
+
+    Tile-diff crops only make sense on top of the full frame they update, so
+    the latest full frame and every partial frame after it are kept even when
+    that is more than `keep_last`.
+
+    Every eviction rewrites an old message and so invalidates the prompt
+    cache from that point on. With `min_removal` > 1 screenshots are only
+    evicted once that many are over the limit, so the cached prefix survives
+    several turns in a row.
+    """
+
+    def __init__(self, keep_last: Optional[int] = 3, min_removal: int = 1):
+        self.keep_last = keep_last
+        self.min_removal = min_removal
+        self.evicted = 0
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+
+    def apply(self, messages: list) -> RetentionStats:
+        frames = _tool_result_frames(messages)
+        if self.keep_last is not None:
+            keyframe = next(
+                (
+                    i
+                    for i in range(len(frames) - 1, -1, -1)
+                    if not _is_partial(frames[i])
+                ),
+                0,
+            )
+            stale = min(len(frames) - self.keep_last, keyframe)
+            if stale >= self.min_removal:
+                for frame in frames[:stale]:
+                    for i, item in enumerate(frame):
+                        if item.get("type") != "image":
+                            continue
+                        data = item["source"]["data"]
+                        self.evicted += 1
+                        self.bytes_saved += len(data)
+                        self.tokens_saved += estimate_image_tokens(data)
+                        frame[i] = {"type": "text", "text": SCREENSHOT_PLACEHOLDER}
+                frames = frames[stale:]
+
+        # Everything evicted so far is left out of this request, so the
+        # per-turn saving is the running total.
+        return RetentionStats(
+            kept=sum(item.get("type") == "image" for frame in frames for item in frame),
+            evicted=self.evicted,
+            bytes_saved=self.bytes_saved,
+            tokens_saved=self.tokens_saved,
+        )
+
+
+def cached_system(prompt: str) -> list:
+    """System prompt blocks with a cache breakpoint after the (static) prompt."""
+    return [{"type": "text", "text": prompt, "cache_control": CACHE_CONTROL}]
+
+
+def cached_tools(tool_params: list) -> list:
+    """Tool definitions with a cache breakpoint after the last one."""
+    tool_params = [dict(params) for params in tool_params]
+    if tool_params:
+        tool_params[-1]["cache_control"] = CACHE_CONTROL
+    return tool_params
+
+
+def mark_cache_breakpoints(messages: list, breakpoints: int = 2) -> None:
+    """Move the rolling conversation cache breakpoints to the latest user turns.
+
+    The newest turn writes the cache for the next request and the one before
+    it reads what the previous request wrote. Together with the system prompt
+    and tool breakpoints this stays within the API limit of four.
+    """
+    remaining = breakpoints
+    for message in reversed(messages):
+        if message["role"] != "user" or not isinstance(message["content"], list):
+            continue
+        for block in message["content"]:
+            block.pop("cache_control", None)
+        if remaining and message["content"]:
+            message["content"][-1]["cache_control"] = CACHE_CONTROL
+            remaining -= 1
+
+
+def estimate_tokens(messages: list) -> int:
+    """Rough token count of a message list, at about four characters per token plus image tokens."""
+    chars = 0
+    tokens = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for block in content:
+            items = [block]
+            if block.get("type") == "tool_result" and isinstance(
+                block.get("content"), list
+            ):
+                items += block["content"]
+            for item in items:
+                if item.get("type") == "text":
+                    chars += len(item["text"])
+                elif item.get("type") == "tool_use":
+                    chars += len(json.dumps(item["input"]))
+                elif item.get("type") == "tool_result" and isinstance(
+                    item.get("content"), str
+                ):
+                    chars += len(item["content"])
+                elif item.get("type") == "image":
+                    tokens += estimate_image_tokens(item["source"]["data"])
+    return tokens + chars // 4
+
+
+def transcript(messages: list, max_result_chars: int = 2000) -> str:
+    """Plain text version of a conversation for summarizing, without images."""
+    lines = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        for block in content:
+            if block.get("type") == "text":
+                lines.append(f"{message['role']}: {block['text']}")
+            elif block.get("type") == "image":
+                lines.append(f"{message['role']}: [image]")
+            elif block.get("type") == "tool_use":
+                lines.append(
+                    f"assistant called {block['name']}: {json.dumps(block['input'])}"
+                )
+            elif block.get("type") == "tool_result":
+                result = block.get("content") or []
+                if isinstance(result, str):
+                    result = [{"type": "text", "text": result}]
+                text = " ".join(
+                    item["text"] for item in result if item.get("type") == "text"
+                )
+                if any(item.get("type") == "image" for item in result):
+                    text += " [screenshot]"
+                lines.append(f"tool result: {text[:max_result_chars]}")
+    return "\n".join(lines)
+
+
+class ContextBudget:
+    """Keeps the conversation under `max_tokens` by summarizing its oldest turns.
+
+    Once the estimate goes over budget, everything between the first user
+    message (the task) and the most recent turns that fit in
+    `keep_fraction` of the budget is replaced with a summary, appended to
+    the first message. The kept part always starts at an assistant message,
+    so every tool_result still follows its tool_use.
+
+    The first message can't be cut, so the turns are measured against the
+    budget it leaves. When it takes up most of the budget by itself, the
+    turns still get `1 - keep_fraction` of it; otherwise the history could
+    never get back under budget and would be summarized again every turn.
+    """
+
+    def __init__(self, max_tokens: int = 100_000, keep_fraction: float = 0.5):
+        self.max_tokens = max_tokens
+        self.keep_fraction = keep_fraction
+        self.compactions = 0
+
+    def find_cut(self, messages: list) -> Optional[int]:
+        """Index of the first message to keep, or None if the history fits."""
+        room = max(
+            self.max_tokens - estimate_tokens(messages[:1]),
+            self.max_tokens * (1 - self.keep_fraction),
+        )
+        if estimate_tokens(messages[1:]) <= room:
+            return None
+        target = room * self.keep_fraction
+        cut = None
+        kept = 0
+        for i in range(len(messages) - 1, 1, -1):
+            kept += estimate_tokens([messages[i]])
+            if messages[i]["role"] != "assistant":
+                continue
+            if kept > target and cut is not None:
+                break
+            cut = i
+        return cut
+
+    def compact(self, messages: list, cut: int, summary: str) -> None:
+        """Replace messages[1:cut] with `summary`, in place."""
+        first = messages[0]
+        content = first["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        content = [
+            block
+            for block in content
+            if not (
+                block.get("type") == "text" and block["text"].startswith(SUMMARY_PREFIX)
+            )
+        ]
+        content.append({"type": "text", "text": f"{SUMMARY_PREFIX}\n{summary}"})
+        messages[:cut] = [{"role": "user", "content": content}]
+        self.compactions += 1
@@ -0,0 +1,368 @@
+import base64
+import io
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+
+MEDIA_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+UNCHANGED_TEXT = "Screen unchanged since previous screenshot."
+# Starts the text of a screenshot sent as crops of the changed regions
+PARTIAL_FRAME_TEXT = "Only part of the screen changed since the previous screenshot."
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+
+
+def perceptual_hash(
+    image: Image.Image, hash_size: int = 16, grid: Tuple[int, int] = (4, 4)
+) -> np.ndarray:
+    """DCT perceptual hash of each cell in a grid over the image.
+
+    Hashing cells separately keeps small local changes, like a new line in
+    a message log, from being averaged away over the whole frame.
+    """
+    size = hash_size * 4
+    dct = _dct_matrix(size)
+    gray = image.convert("L")
+    width, height = gray.size
+    hashes = []
+    for row in range(grid[1]):
+        for col in range(grid[0]):
+            cell = gray.crop(
+                (
+                    col * width // grid[0],
+                    row * height // grid[1],
+                    (col + 1) * width // grid[0],
+                    (row + 1) * height // grid[1],
+                )
+            ).resize((size, size), Image.BILINEAR)
+            pixels = np.asarray(cell, dtype=np.float64)
+            low = (dct @ pixels @ dct.T)[:hash_size, :hash_size].flatten()[1:]
+            hashes.append(low > np.median(low))
+    return np.array(hashes)
+
+
+def hash_distance(a: np.ndarray, b: np.ndarray) -> int:
+    """Largest number of differing bits in any grid cell."""
+    return int((a != b).sum(axis=1).max())
+
+
+def changed_regions(changed: np.ndarray, size: Tuple[int, int]) -> list:
+    """Pixel bounding boxes (x0, y0, x1, y1) of connected groups of changed grid cells."""
+    rows, cols = changed.shape
+    width, height = size
+    seen = np.zeros_like(changed)
+    boxes = []
+    for row in range(rows):
+        for col in range(cols):
+            if not changed[row, col] or seen[row, col]:
+                continue
+            stack = [(row, col)]
+            seen[row, col] = True
+            top, left, bottom, right = row, col, row, col
+            while stack:
+                r, c = stack.pop()
+                top, left = min(top, r), min(left, c)
+                bottom, right = max(bottom, r), max(right, c)
+                for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                    if (
+                        0 <= nr < rows
+                        and 0 <= nc < cols
+                        and changed[nr, nc]
+                        and not seen[nr, nc]
+                    ):
+                        seen[nr, nc] = True
+                        stack.append((nr, nc))
+            boxes.append(
+                (
+                    left * width // cols,
+                    top * height // rows,
+                    (right + 1) * width // cols,
+                    (bottom + 1) * height // rows,
+                )
+            )
+    return boxes
+
+
+@dataclass
+class ProcessedScreenshot:
+    data: str
+    media_type: str
+    original_bytes: int
+    processed_bytes: int
+
+
+class ScreenshotProcessor:
+    """Downscales and re-encodes screenshots before they enter the conversation.
+
+    The defaults leave screenshots untouched. When `max_long_edge` shrinks
+    the image, the computer tool has to advertise the scaled display size
+    and scale the model's coordinates back up, see `target_size` and
+    `to_display`.
+
+    With `dedupe_threshold` set, a screenshot whose perceptual hash is within
+    that many bits of the last screenshot sent is replaced with a short
+    "unchanged" note.
+
+    With `tile_diff` on, each frame is compared with what Claude has already
+    seen on a `tile_grid` of cells. If at most `max_changed_fraction` of the
+    cells changed, only crops of the changed regions are sent along with
+    their coordinates. A full frame is sent every `keyframe_interval` frames.
+    """
+
+    def __init__(
+        self,
+        max_long_edge: Optional[int] = None,
+        grayscale: bool = False,
+        format: str = "PNG",
+        quality: int = 80,
+        dedupe_threshold: Optional[int] = None,
+        tile_diff: bool = False,
+        tile_grid: Tuple[int, int] = (16, 12),
+        max_changed_fraction: float = 0.3,
+        keyframe_interval: int = 10,
+        verbose: bool = True,
+    ):
+        self.format = format.upper()
+        if self.format not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported screenshot format: {format}")
+        self.max_long_edge = max_long_edge
+        self.grayscale = grayscale
+        self.quality = quality
+        self.dedupe_threshold = dedupe_threshold
+        self.verbose = verbose
+        self.original_bytes = 0
+        self.processed_bytes = 0
+        self.last_hash: Optional[np.ndarray] = None
+        self.duplicates = 0
+        self.duplicate_bytes = 0
+        self.tile_diff = tile_diff
+        self.tile_grid = tile_grid
+        self.max_changed_fraction = max_changed_fraction
+        self.keyframe_interval = keyframe_interval
+        # Grayscale pixels of the screen as Claude last saw it, and how many
+        # partial updates were sent since the last full frame
+        self.reference: Optional[np.ndarray] = None
+        self.frames_since_keyframe = 0
+
+    def reset(self) -> None:
+        """Forget the screenshots sent so far, so the next one is sent in full.
+
+        Call it whenever a new conversation starts: dedupe and tile diffs
+        compare against what Claude last saw, and a new conversation has seen
+        nothing.
+        """
+        self.last_hash = None
+        self.reference = None
+        self.frames_since_keyframe = 0
+
+    @property
+    def is_passthrough(self) -> bool:
+        return (
+            self.max_long_edge is None and not self.grayscale and self.format == "PNG"
+        )
+
+    def target_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Size a width x height screenshot is scaled to."""
+        if not self.max_long_edge or max(width, height) <= self.max_long_edge:
+            return width, height
+        scale = self.max_long_edge / max(width, height)
+        return round(width * scale), round(height * scale)
+
+    def to_display(self, coordinate: list, display_size: Tuple[int, int]) -> list:
+        """Map a coordinate in the scaled screenshot back to the real display."""
+        width, height = self.target_size(*display_size)
+        return [
+            round(coordinate[0] * display_size[0] / width),
+            round(coordinate[1] * display_size[1] / height),
+        ]
+
+    def to_screenshot(self, coordinate: list, display_size: Tuple[int, int]) -> list:
+        """Map a coordinate on the real display into the scaled screenshot."""
+        width, height = self.target_size(*display_size)
+        return [
+            round(coordinate[0] * width / display_size[0]),
+            round(coordinate[1] * height / display_size[1]),
+        ]
+
+    def prepare(self, image: Image.Image) -> Image.Image:
+        """Resize and convert a decoded screenshot for encoding."""
+        size = self.target_size(*image.size)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+        if self.grayscale:
+            return image.convert("L")
+        if self.format == "JPEG" or image.mode not in ("RGB", "L"):
+            return image.convert("RGB")
+        return image
+
+    def encode(self, image: Image.Image) -> str:
+        buffer = io.BytesIO()
+        if self.format == "PNG":
+            image.save(buffer, format="PNG", optimize=True)
+        else:
+            image.save(buffer, format=self.format, quality=self.quality)
+        return base64.b64encode(buffer.getvalue()).decode()
+
+    def process(
+        self, data: str, image: Optional[Image.Image] = None
+    ) -> ProcessedScreenshot:
+        if self.is_passthrough:
+            processed = ProcessedScreenshot(data, "image/png", len(data), len(data))
+        else:
+            if image is None:
+                image = Image.open(io.BytesIO(base64.b64decode(data)))
+            encoded = self.encode(self.prepare(image))
+            processed = ProcessedScreenshot(
+                encoded, MEDIA_TYPES[self.format], len(data), len(encoded)
+            )
+
+        self.original_bytes += processed.original_bytes
+        self.processed_bytes += processed.processed_bytes
+        if self.verbose and not self.is_passthrough:
+            print(
+                f"Screenshot: {processed.original_bytes // 1024} KB -> "
+                f"{processed.processed_bytes // 1024} KB"
+            )
+        return processed
+
+    def is_duplicate(self, image: Image.Image) -> bool:
+        """Whether the frame matches the last one sent, remembering it if not."""
+        frame_hash = perceptual_hash(image)
+        if (
+            self.last_hash is not None
+            and hash_distance(frame_hash, self.last_hash) <= self.dedupe_threshold
+        ):
+            return True
+        self.last_hash = frame_hash
+        return False
+
+    def changed_cells(self, pixels: np.ndarray) -> np.ndarray:
+        """Grid of cells that differ noticeably from the reference frame."""
+        cols, rows = self.tile_grid
+        height, width = pixels.shape
+        diff = np.abs(pixels - self.reference)
+        changed = np.zeros((rows, cols), dtype=bool)
+        for row in range(rows):
+            for col in range(cols):
+                cell = diff[
+                    row * height // rows : (row + 1) * height // rows,
+                    col * width // cols : (col + 1) * width // cols,
+                ]
+                changed[row, col] = cell.max() > 16
+        return changed
+
+    def diff_content(self, frame: Image.Image, original_bytes: int) -> Optional[list]:
+        """Content blocks with only the changed regions, or None when a full frame is due."""
+        pixels = np.asarray(frame.convert("L"), dtype=np.int16)
+        if (
+            self.reference is None
+            or self.reference.shape != pixels.shape
+            or self.frames_since_keyframe >= self.keyframe_interval
+        ):
+            return None
+        changed = self.changed_cells(pixels)
+        if changed.mean() > self.max_changed_fraction:
+            return None
+
+        self.frames_since_keyframe += 1
+        if not changed.any():
+            return [{"type": "text", "text": UNCHANGED_TEXT}]
+
+        content = [
+            {
+                "type": "text",
+                "text": f"{PARTIAL_FRAME_TEXT} The changed regions follow as (x0, y0, x1, y1) in screenshot pixels; "
+                "everything else is as before.",
+            }
+        ]
+        sent_bytes = 0
+        for x0, y0, x1, y1 in changed_regions(changed, frame.size):
+            encoded = self.encode(frame.crop((x0, y0, x1, y1)))
+            sent_bytes += len(encoded)
+            content.append(
+                {"type": "text", "text": f"Region ({x0}, {y0}, {x1}, {y1}):"}
+            )
+            content.append(
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": MEDIA_TYPES[self.format],
+                        "data": encoded,
+                    },
+                }
+            )
+            self.reference[y0:y1, x0:x1] = pixels[y0:y1, x0:x1]
+
+        self.original_bytes += original_bytes
+        self.processed_bytes += sent_bytes
+        if self.verbose:
+            print(
+                f"Screenshot: {original_bytes // 1024} KB -> {sent_bytes // 1024} KB "
+                f"({len(content) // 2} changed regions)"
+            )
+        return content
+
+    def to_content(self, data: str) -> list:
+        """Content blocks for a screenshot inside a tool result."""
+        image = None
+        if self.dedupe_threshold is not None:
+            image = Image.open(io.BytesIO(base64.b64decode(data)))
+            if self.is_duplicate(image):
+                self.duplicates += 1
+                self.duplicate_bytes += len(data)
+                if self.verbose:
+                    print(f"Screenshot unchanged, not sent ({len(data) // 1024} KB)")
+                return [{"type": "text", "text": UNCHANGED_TEXT}]
+
+        if self.tile_diff:
+            if image is None:
+                image = Image.open(io.BytesIO(base64.b64decode(data)))
+            frame = self.prepare(image)
+            content = self.diff_content(frame, len(data))
+            if content is not None:
+                return content
+            self.reference = np.asarray(frame.convert("L"), dtype=np.int16).copy()
+            self.frames_since_keyframe = 0
+
+        processed = self.process(data, image)
+        return [
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": processed.media_type,
+                    "data": processed.data,
+                },
+            }
+        ]
+
+
+if __name__ == "__main__":
+    # Compare bytes per screenshot for full frames vs. tile diffs on a
+    # recorded sequence: python images.py frame1.png frame2.png ...
+    import sys
+
+    frames = []
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            frames.append(base64.b64encode(f.read()).decode())
+
+    def content_bytes(content: list) -> int:
+        return sum(len(c["source"]["data"]) for c in content if c["type"] == "image")
+
+    for fmt in ("PNG", "JPEG"):
+        full = ScreenshotProcessor(format=fmt, verbose=False)
+        tiled = ScreenshotProcessor(format=fmt, tile_diff=True, verbose=False)
+        full_bytes = [content_bytes(full.to_content(frame)) for frame in frames]
+        tiled_bytes = [content_bytes(tiled.to_content(frame)) for frame in frames]
+        print(
+            f"{fmt}: full {sum(full_bytes) // max(len(frames), 1) // 1024} KB/turn, "
+            f"tile diff {sum(tiled_bytes) // max(len(frames), 1) // 1024} KB/turn "
+            f"over {len(frames)} screenshots"
+        )
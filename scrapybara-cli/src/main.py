@@ -5,10 +5,17 @@ from dotenv import load_dotenv
 from rich.console import Console
 from rich import print
 import os
+from typing import List, Optional
 from getpass import getpass
 from .helpers import ToolCollection
+from .images import ScreenshotProcessor
 from scrapybara.anthropic import ComputerTool, BashTool, EditTool
 from .agent import run_agent
+from .pool import InstancePool
+from .checkpoint import Checkpointer
+from .provision import Provisioner, Step
+from .warmup import App, Warmup, parse_apps
+from anthropic import AsyncAnthropic
 
 load_dotenv()
 
@@ -20,7 +27,55 @@ app = typer.Typer()
 def main(
     instance_type: str = typer.Option(
         "small", help="Size of the instance. Must be one of: 'small', 'medium', 'large'"
-    )
+    ),
+    keep_screenshots: int = typer.Option(
+        3,
+        help="Number of recent screenshots to keep in the conversation (-1 keeps all)",
+    ),
+    screenshot_size: int = typer.Option(
+        0, help="Downscale screenshots to this long edge in pixels (0 keeps full size)"
+    ),
+    screenshot_format: str = typer.Option(
+        "png", help="Screenshot encoding. Must be one of: 'png', 'jpeg', 'webp'"
+    ),
+    screenshot_quality: int = typer.Option(80, help="JPEG/WebP screenshot quality"),
+    grayscale: bool = typer.Option(False, help="Send screenshots in grayscale"),
+    dedupe_threshold: int = typer.Option(
+        -1,
+        help="Replace screenshots within this many hash bits of the previous one with a note (-1 disables)",
+    ),
+    tile_diff: bool = typer.Option(
+        False, help="Send only the changed regions of consecutive screenshots"
+    ),
+    trace: Optional[str] = typer.Option(
+        None, help="Append per-turn timing and token stats to this JSONL file"
+    ),
+    pool_size: int = typer.Option(
+        0,
+        help="Keep this many started instances warm for the next run (0 starts and stops one per run)",
+    ),
+    pool_ttl: int = typer.Option(
+        15, help="Minutes a pooled instance may sit idle before it is stopped"
+    ),
+    context_budget: int = typer.Option(
+        100_000,
+        help="Summarize the oldest turns once the conversation is estimated to exceed this many tokens (0 disables)",
+    ),
+    checkpoint: Optional[str] = typer.Option(
+        None, help="Save the current task's conversation to this file after every turn"
+    ),
+    resume: Optional[str] = typer.Option(
+        None,
+        help="Continue the task saved in this checkpoint on its (still running) instance",
+    ),
+    setup: Optional[List[str]] = typer.Option(
+        None,
+        help="Shell command to run once on the instance before the first prompt; repeatable, skipped on instances that already ran it",
+    ),
+    warmup: Optional[List[str]] = typer.Option(
+        None,
+        help="GUI app to open while you type the first prompt: chromium, libreoffice, xterm or NAME=COMMAND; repeatable",
+    ),
 ):
     """
     Run the CLI-based computer agent, powered by Scrapybara and Anthropic!
@@ -46,44 +101,187 @@ def main(
             'instance_type must be one of: "small", "medium", "large"'
         )
 
+    if screenshot_format not in ["png", "jpeg", "webp"]:
+        raise typer.BadParameter(
+            'screenshot_format must be one of: "png", "jpeg", "webp"'
+        )
+
+    try:
+        warmup_apps = parse_apps(warmup or [])
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+    processor = ScreenshotProcessor(
+        max_long_edge=screenshot_size or None,
+        grayscale=grayscale,
+        format=screenshot_format,
+        quality=screenshot_quality,
+        dedupe_threshold=dedupe_threshold if dedupe_threshold >= 0 else None,
+        tile_diff=tile_diff,
+    )
+
     # Initialize Scrapybara with the API key
     scrapybara = Scrapybara(api_key=scrapybara_key)
+    pool = (
+        InstancePool(scrapybara, size=pool_size, ttl=pool_ttl * 60)
+        if pool_size > 0
+        else None
+    )
 
-    asyncio.run(async_main(instance_type, scrapybara))
+    asyncio.run(
+        async_main(
+            instance_type,
+            scrapybara,
+            keep_screenshots if keep_screenshots >= 0 else None,
+            processor,
+            trace,
+            pool,
+            checkpoint,
+            resume,
+            context_budget,
+            [Step(f"setup-{i + 1}", command) for i, command in enumerate(setup or [])],
+            warmup_apps,
+        )
+    )
 
 
-async def async_main(instance_type: str, scrapybara: Scrapybara):
+async def async_main(
+    instance_type: str,
+    scrapybara: Scrapybara,
+    keep_screenshots: Optional[int] = 3,
+    processor: Optional[ScreenshotProcessor] = None,
+    trace_path: Optional[str] = None,
+    pool: Optional[InstancePool] = None,
+    checkpoint_path: Optional[str] = None,
+    resume_path: Optional[str] = None,
+    context_budget: Optional[int] = 100_000,
+    setup_steps: Optional[List[Step]] = None,
+    warmup_apps: Optional[List[App]] = None,
+):
+    instance = None
+    resumed = None
+    # Set while a task runs, so an interrupted task's instance is kept for --resume
+    in_task = False
+    checkpointer = None
+    if resume_path or checkpoint_path:
+        # Resuming keeps checkpointing to the same file unless told otherwise
+        checkpointer = Checkpointer(checkpoint_path or resume_path)
     try:
         with console.status(
             "[bold green]Starting instance...[/bold green]", spinner="dots"
         ) as status:
-            instance = scrapybara.start(instance_type=instance_type)
+            if resume_path:
+                resumed = Checkpointer(resume_path).load()
+                saved_instance = scrapybara.get(resumed.instance_id)
+                if saved_instance.status != "running":
+                    raise RuntimeError(
+                        f"Instance {saved_instance.id} from the checkpoint is {saved_instance.status}"
+                    )
+                instance = saved_instance
+            elif pool:
+                instance = pool.lease(instance_type)
+                # Start the next run's instance while this one is in use
+                pool.fill_in_background(instance_type)
+            else:
+                instance = scrapybara.start(instance_type=instance_type)
             status.update("[bold green]Instance started![/bold green]")
 
+            if setup_steps:
+                status.update("[bold green]Setting up instance...[/bold green]")
+                report = Provisioner(setup_steps).run(instance)
+                print(f"[bold blue]{report.summary()}[/bold blue]")
+                if not report.ok:
+                    raise RuntimeError(
+                        f"Setup step {report.steps[-1].name} failed:\n{report.steps[-1].output}"
+                    )
+
         stream_url = instance.get_stream_url().stream_url
         print(
             f"[bold blue]Stream URL: {stream_url}/?resize=scale&autoconnect=1[/bold blue]"
         )
 
+        # Open the apps while the first prompt is typed; the first task waits
+        # for them and is told they are ready
+        warmup = None
+        if warmup_apps:
+            warmup = asyncio.get_event_loop().run_in_executor(
+                None, Warmup(warmup_apps).run, instance
+            )
+
+        # One client (and HTTP connection pool) for the whole session
+        anthropic = AsyncAnthropic()
+
         tools = ToolCollection(
             ComputerTool(instance),
             BashTool(instance),
             EditTool(instance),
+            processor=processor,
         )
 
+        if resumed and resumed.in_progress:
+            print("[bold green]Resuming the interrupted task[/bold green]")
+            in_task = True
+            await run_agent(
+                anthropic,
+                instance,
+                tools,
+                None,
+                keep_screenshots,
+                trace_path,
+                checkpointer,
+                resumed.messages,
+                context_budget,
+            )
+            in_task = False
+
         while True:
             prompt = input("> ")
-            await run_agent(instance, tools, prompt)
+            in_task = True
+            context = None
+            if warmup:
+                with console.status(
+                    "[bold green]Waiting for apps to open...[/bold green]",
+                    spinner="dots",
+                ):
+                    report = await warmup
+                print(f"[bold blue]{report.summary()}[/bold blue]")
+                context = report.note()
+                warmup = None
+            await run_agent(
+                anthropic,
+                instance,
+                tools,
+                prompt,
+                keep_screenshots,
+                trace_path,
+                checkpointer,
+                context_budget=context_budget,
+                context=context,
+            )
+            in_task = False
 
     except Exception as e:
         print(f"[bold red]{e}[/bold red]")
 
     finally:
-        with console.status(
-            "[bold red]Stopping instance...[/bold red]", spinner="dots"
-        ) as status:
-            instance.stop()
-            status.update("[bold red]Instance stopped![/bold red]")
+        if instance and checkpointer and in_task:
+            print(
+                f"[bold yellow]Leaving instance {instance.id} running, continue with "
+                f"--resume {checkpointer.path}[/bold yellow]"
+            )
+        elif instance and pool:
+            with console.status(
+                "[bold red]Returning instance to the pool...[/bold red]",
+                spinner="dots",
+            ) as status:
+                pool.release(instance)
+                status.update("[bold red]Instance returned![/bold red]")
+        elif instance:
+            with console.status(
+                "[bold red]Stopping instance...[/bold red]", spinner="dots"
+            ) as status:
+                instance.stop()
+                status.update("[bold red]Instance stopped![/bold red]")
 
 
 if __name__ == "__main__":
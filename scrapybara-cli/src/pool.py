@@ -0,0 +1,342 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the pool is only safe within one process
+    fcntl = None
+
+DEFAULT_STATE_PATH = os.path.join(os.path.expanduser("~"), ".scrapybara", "pool.json")
+
+# Close whatever the last session left open and clear scratch files, but keep
+# installed packages so the next lease doesn't have to reinstall them
+RESET_COMMAND = (
+    "pkill -f 'chromium|crawl|libreoffice|xterm' ; "
+    "rm -rf /tmp/* ~/Downloads/* 2>/dev/null ; true"
+)
+
+
+class InstancePool:
+    """Keeps up to `size` started instances per instance type between runs.
+
+    Instances are recorded in a JSON state file so the next process can
+    lease an idle one instead of waiting for a cold start. Leased instances
+    stay recorded until they are released, and count towards `size`
+    together with the idle ones, so the pool never holds more than `size`
+    instances of a type. `release` resets an instance and returns it to the
+    pool, so setup done on it is reused by the next lease. `fill` only
+    starts instances for the part of the pool that is neither idle nor
+    leased. Idle instances older than `ttl` seconds, or too close to their
+    `timeout_hours` limit, are stopped the next time the pool is used.
+
+    `client` only needs `start(instance_type=, timeout_hours=)` and
+    `get(instance_id)` returning objects with `id`, `instance_type`,
+    `status`, `bash(command=)` and `stop()`, like FakeClient below.
+    """
+
+    def __init__(
+        self,
+        client,
+        size: int = 1,
+        ttl: float = 15 * 60,
+        state_path: str = DEFAULT_STATE_PATH,
+        reset_command: Optional[str] = RESET_COMMAND,
+        timeout_hours: float = 2.0,
+        min_remaining: float = 30 * 60,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.client = client
+        self.size = size
+        self.ttl = ttl
+        self.state_path = state_path
+        self.reset_command = reset_command
+        self.timeout_hours = timeout_hours
+        self.min_remaining = min_remaining
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """Load the state file for modification, holding the pool lock."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        with self.lock, open(self.state_path + ".lock", "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.state_path) as f:
+                    state = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                state = {}
+            yield state
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    def _stop(self, instance_id: str) -> None:
+        try:
+            self.client.get(instance_id).stop()
+        except Exception as e:
+            print(f"Could not stop pooled instance {instance_id}: {e}")
+
+    def _is_stale(self, entry: dict) -> bool:
+        now = self.clock()
+        if entry.get("status", "idle") != "idle":
+            # A leased or starting instance whose process died without
+            # releasing it; it is past its own timeout, so only forget it
+            return entry["expires_at"] < now
+        return (
+            now - entry["idle_since"] > self.ttl
+            or entry["expires_at"] - now < self.min_remaining
+        )
+
+    def reap(self) -> int:
+        """Stop idle instances past the TTL and forget them. Returns how many."""
+        with self._state() as state:
+            stale = []
+            for instance_type, entries in state.items():
+                state[instance_type] = [e for e in entries if not self._is_stale(e)]
+                stale += [e for e in entries if self._is_stale(e)]
+        for entry in stale:
+            if entry.get("status", "idle") == "idle":
+                self._stop(entry["id"])
+        return len(stale)
+
+    def idle(self, instance_type: str) -> list:
+        """Ids of the idle instances of a type."""
+        with self._state() as state:
+            return [
+                entry["id"]
+                for entry in state.get(instance_type, [])
+                if entry.get("status", "idle") == "idle"
+            ]
+
+    def lease(self, instance_type: str):
+        """Take an idle instance of `instance_type`, or start one if there is none."""
+        self.reap()
+        while True:
+            with self._state() as state:
+                entries = state.setdefault(instance_type, [])
+                entry = next(
+                    (e for e in entries if e.get("status", "idle") == "idle"), None
+                )
+                if entry is None:
+                    # Reserve a place for the instance started below, if the
+                    # pool has room, so it is kept when released
+                    pooled = len(entries) < self.size
+                    if pooled:
+                        entry = self._entry(None, "starting")
+                        entries.append(entry)
+                    break
+                entry["status"] = "leased"
+            try:
+                instance = self.client.get(entry["id"])
+                running = instance.status == "running"
+            except Exception as e:
+                print(f"Pooled instance {entry['id']} is gone: {e}")
+                instance, running = None, False
+            if running:
+                print(f"Leased warm instance {instance.id}")
+                return instance
+            # Still deploying or already terminated, not worth waiting for
+            self._forget(instance_type, entry)
+            if instance is not None:
+                self._stop(entry["id"])
+
+        try:
+            instance = self.client.start(
+                instance_type=instance_type, timeout_hours=self.timeout_hours
+            )
+        except Exception:
+            if pooled:
+                self._forget(instance_type, entry)
+            raise
+        if pooled:
+            self._update(instance_type, entry, self._entry(instance, "leased"))
+        return instance
+
+    def release(self, instance) -> None:
+        """Reset an instance and keep it for the next lease, or stop it if the pool is full."""
+        try:
+            if self.reset_command:
+                instance.bash(command=self.reset_command)
+        except Exception as e:
+            print(f"Could not reset instance {instance.id}, stopping it: {e}")
+            self._forget(instance.instance_type, {"id": instance.id})
+            instance.stop()
+            return
+
+        with self._state() as state:
+            entries = state.setdefault(instance.instance_type, [])
+            entry = next((e for e in entries if e["id"] == instance.id), None)
+            # An instance of this pool always goes back into it; one started
+            # outside it is kept if there is room
+            keep = entry is not None or len(entries) < self.size
+            if entry is not None:
+                entries.remove(entry)
+            if keep:
+                entries.append(self._entry(instance, "idle"))
+        if not keep:
+            instance.stop()
+
+    def _entry(self, instance, status: str) -> dict:
+        now = self.clock()
+        if instance is None:
+            # A start in progress; forgotten by reap if it never finishes
+            return {
+                "id": None,
+                "status": status,
+                "idle_since": now,
+                "expires_at": now + 3600,
+            }
+        launch_time = getattr(instance, "launch_time", None)
+        launched = launch_time.timestamp() if launch_time else now
+        return {
+            "id": instance.id,
+            "status": status,
+            "idle_since": now,
+            "expires_at": launched + self.timeout_hours * 3600,
+        }
+
+    def _update(self, instance_type: str, old: dict, new: dict) -> None:
+        with self._state() as state:
+            entries = state.setdefault(instance_type, [])
+            for i, entry in enumerate(entries):
+                if entry == old:
+                    entries[i] = new
+                    return
+            entries.append(new)
+
+    def _forget(self, instance_type: str, old: dict) -> None:
+        with self._state() as state:
+            entries = state.get(instance_type, [])
+            for i, entry in enumerate(entries):
+                if entry == old or (old["id"] and entry["id"] == old["id"]):
+                    del entries[i]
+                    return
+
+    def fill(self, instance_type: str) -> int:
+        """Start instances until the pool holds `size` of `instance_type`,
+        idle or leased. Returns how many were started."""
+        # Count and reserve under one lock, so concurrent fills don't both
+        # start the missing instances
+        with self._state() as state:
+            entries = state.setdefault(instance_type, [])
+            reserved = [
+                self._entry(None, "starting")
+                for _ in range(max(self.size - len(entries), 0))
+            ]
+            entries.extend(reserved)
+        if not reserved:
+            return 0
+
+        def start(entry: dict):
+            try:
+                instance = self.client.start(
+                    instance_type=instance_type, timeout_hours=self.timeout_hours
+                )
+            except Exception as e:
+                print(f"Could not start a pooled instance: {e}")
+                self._forget(instance_type, entry)
+                return None
+            self._update(instance_type, entry, self._entry(instance, "idle"))
+            return instance
+
+        with ThreadPoolExecutor(max_workers=len(reserved)) as executor:
+            instances = list(executor.map(start, reserved))
+        return sum(instance is not None for instance in instances)
+
+    def fill_in_background(self, instance_type: str) -> threading.Thread:
+        """Top the pool up while the current lease is in use."""
+        thread = threading.Thread(target=self.fill, args=(instance_type,))
+        thread.start()
+        return thread
+
+    def drain(self) -> int:
+        """Stop every idle instance. Returns how many."""
+        with self._state() as state:
+            entries = []
+            for instance_type in state:
+                entries += [
+                    e for e in state[instance_type] if e.get("status", "idle") == "idle"
+                ]
+                state[instance_type] = [
+                    e for e in state[instance_type] if e.get("status", "idle") != "idle"
+                ]
+        for entry in entries:
+            self._stop(entry["id"])
+        return len(entries)
+
+
+class FakeInstance:
+    def __init__(self, client: "FakeClient", instance_type: str, number: int):
+        self.id = f"fake-{number}"
+        self.instance_type = instance_type
+        self.status = "running"
+        self.client = client
+        # Commands are only recorded, never run
+        self.commands: list = []
+
+    def bash(self, command: str) -> dict:
+        self.commands.append(command)
+        return {"output": ""}
+
+    def stop(self) -> None:
+        with self.client.lock:
+            if self.status == "running":
+                self.client.stopped += 1
+            self.status = "terminated"
+
+
+class FakeClient:
+    """Offline stand-in for the Scrapybara client that counts instances."""
+
+    def __init__(self):
+        self.started = 0
+        self.stopped = 0
+        self.instances: dict = {}
+        self.lock = threading.Lock()
+
+    def start(self, instance_type: str, timeout_hours: float = 1.0) -> FakeInstance:
+        with self.lock:
+            self.started += 1
+            instance = FakeInstance(self, instance_type, self.started)
+            self.instances[instance.id] = instance
+        return instance
+
+    def get(self, instance_id: str) -> FakeInstance:
+        return self.instances[instance_id]
+
+    @property
+    def running(self) -> int:
+        return self.started - self.stopped
+
+
+if __name__ == "__main__":
+    # Simulate runs against a fake client and show how many instances were
+    # started, reused and billed: python -m src.pool [runs] [size]
+    import sys
+    import tempfile
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    client = FakeClient()
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = InstancePool(client, size=size, state_path=f"{tmp}/pool.json")
+        for run in range(runs):
+            instance = pool.lease("small")
+            pool.fill_in_background("small").join()
+            pool.release(instance)
+            print(
+                f"Run {run + 1}: used {instance.id}, {client.started} started, "
+                f"{client.running} running, idle {pool.idle('small')}"
+            )
+        pool.drain()
+    print(
+        f"{client.started} instances started for {runs} runs, {client.running} left running"
+    )
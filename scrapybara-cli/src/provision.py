@@ -0,0 +1,118 @@
+import hashlib
+import shlex
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# Outside /tmp, which the instance pool clears between leases
+MARKER_DIR = "~/.cache/scrapybara-provision"
+SKIPPED = "__provision_skipped__"
+DONE = "__provision_done__"
+
+
+@dataclass(frozen=True)
+class Step:
+    """One setup command. Its marker is keyed by a hash of the command, so
+    editing the command makes it run again on instances that ran the old one."""
+
+    name: str
+    command: str
+    # Shell test that succeeds when the step's work is already there without
+    # a marker, e.g. a package baked into the image
+    check: Optional[str] = None
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(f"{self.command}\n{self.check}".encode()).hexdigest()[:16]
+
+
+def apt_step(name: str, *packages: str) -> Step:
+    """Step installing Debian packages, skipped when they are already installed."""
+    names = " ".join(shlex.quote(package) for package in packages)
+    return Step(
+        name,
+        # No recommends and no fsync per file; both cut install time a lot and
+        # an instance never needs to survive a power loss mid-install
+        "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y "
+        "--no-install-recommends -o Dpkg::Options::=--force-unsafe-io "
+        f"{names} || (sudo apt-get update && sudo DEBIAN_FRONTEND=noninteractive "
+        f"apt-get install -y --no-install-recommends {names})",
+        check=f"dpkg -s {names} >/dev/null 2>&1",
+    )
+
+
+@dataclass
+class StepResult:
+    name: str
+    status: str  # "skipped", "ran" or "failed"
+    seconds: float
+    output: str = ""
+
+
+@dataclass
+class ProvisionReport:
+    steps: List[StepResult] = field(default_factory=list)
+
+    @property
+    def seconds(self) -> float:
+        return sum(step.seconds for step in self.steps)
+
+    @property
+    def ok(self) -> bool:
+        return all(step.status != "failed" for step in self.steps)
+
+    def summary(self) -> str:
+        steps = ", ".join(
+            f"{step.name} {step.status} {step.seconds:.1f}s" for step in self.steps
+        )
+        return f"Provisioned in {self.seconds:.1f}s ({steps or 'no steps'})"
+
+
+class Provisioner:
+    """Runs setup steps on an instance once, skipping those it already ran.
+
+    A step that succeeds leaves a marker file named after its hash on the
+    instance. On an instance that already has the marker (a pooled or
+    resumed one) or that passes the step's `check`, the step is skipped, so
+    only the first lease of an instance pays for setup.
+    """
+
+    def __init__(self, steps: List[Step], marker_dir: str = MARKER_DIR):
+        self.steps = steps
+        self.marker_dir = marker_dir
+
+    def script(self, step: Step) -> str:
+        marker = f"{self.marker_dir}/{step.name}-{step.digest}"
+        check = f" || ({step.check})" if step.check else ""
+        # instance.bash runs in the shell the model's bash tool uses too, so
+        # the script must not exit it or leave variables behind. The command
+        # gets lines of its own so heredocs in it end where they should.
+        return (
+            f"if [ -f {marker} ]{check}; then echo {SKIPPED}; else\n"
+            f"(\n{step.command}\n) && mkdir -p {self.marker_dir} && touch {marker} "
+            f"&& echo {DONE}\nfi"
+        )
+
+    def run_step(self, instance, step: Step) -> StepResult:
+        started = time.perf_counter()
+        try:
+            result = instance.bash(command=self.script(step)) or {}
+            output = (result.get("output") or "") + (result.get("error") or "")
+        except Exception as e:
+            output = str(e)
+        seconds = time.perf_counter() - started
+        if SKIPPED in output:
+            return StepResult(step.name, "skipped", seconds)
+        if DONE in output:
+            return StepResult(step.name, "ran", seconds)
+        return StepResult(step.name, "failed", seconds, output[-2000:])
+
+    def run(self, instance) -> ProvisionReport:
+        """Run the steps in order, stopping at the first that fails."""
+        report = ProvisionReport()
+        for step in self.steps:
+            result = self.run_step(instance, step)
+            report.steps.append(result)
+            if result.status == "failed":
+                break
+        return report
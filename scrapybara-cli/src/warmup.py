@@ -0,0 +1,156 @@
+import re
+import shlex
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class App:
+    """A GUI app to have open before the model's first turn."""
+
+    name: str
+    command: str
+    # `xdotool search` options matching the app's window
+    window: str
+
+
+APPS: Dict[str, App] = {
+    "chromium": App(
+        "Chromium",
+        # Skip the first-run and default-browser dialogs the model would have
+        # to click away
+        "chromium --no-first-run --no-default-browser-check",
+        "--class chromium",
+    ),
+    "libreoffice": App(
+        "LibreOffice Writer",
+        "libreoffice --writer --norestore",
+        "--class libreoffice",
+    ),
+    "xterm": App("xterm", "xterm", "--class xterm"),
+}
+
+
+@dataclass
+class AppResult:
+    name: str
+    status: str  # "launched", "running" (already open) or "timeout"
+    seconds: float = 0.0
+
+
+@dataclass
+class WarmupReport:
+    apps: List[AppResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def ready(self) -> List[str]:
+        return [app.name for app in self.apps if app.status != "timeout"]
+
+    def summary(self) -> str:
+        apps = ", ".join(
+            f"{app.name} {app.status} {app.seconds:.1f}s" for app in self.apps
+        )
+        return f"Warmed up in {self.seconds:.1f}s ({apps or 'no apps'})"
+
+    def note(self) -> Optional[str]:
+        """Line for the model's first message saying which apps are open."""
+        if not self.ready:
+            return None
+        names = " and ".join(filter(None, [", ".join(self.ready[:-1]), self.ready[-1]]))
+        return (
+            f"{names} {'is' if len(self.ready) == 1 else 'are'} already open and "
+            "ready on the screen; use the open window instead of starting "
+            "another one."
+        )
+
+
+class Warmup:
+    """Launches GUI apps on an instance and waits until their windows show.
+
+    All apps start at once and their windows are polled on the instance in
+    a single bash call, so the model's first screenshot already shows them
+    instead of it launching each app and taking screenshots until it loads.
+    Apps whose window is already open (e.g. on a resumed instance) are not
+    launched again.
+    """
+
+    def __init__(self, apps: List[App], timeout: float = 30, interval: float = 0.2):
+        self.apps = apps
+        self.timeout = timeout
+        self.interval = interval
+
+    def script(self) -> str:
+        lines = ["export DISPLAY=:1", "now() { date +%s%3N; }", "start=$(now)"]
+        for i, app in enumerate(self.apps):
+            lines.append(
+                f"window_{i}() {{ xdotool search --onlyvisible {app.window} "
+                ">/dev/null 2>&1; }"
+            )
+        pending = []
+        for i, app in enumerate(self.apps):
+            lines.append(
+                f"if window_{i}; then echo 'warmup {i} running 0'; else "
+                f"(nohup {app.command} >/dev/null 2>&1 &); fi"
+            )
+            pending.append(str(i))
+        lines += [
+            # Apps found open above are found again here; their first line wins
+            f"pending='{' '.join(pending)}'",
+            f"deadline=$((start + {int(self.timeout * 1000)}))",
+            'while [ -n "$pending" ] && [ "$(now)" -lt "$deadline" ]; do',
+            "    left=''",
+            "    for i in $pending; do",
+            '        if window_$i; then echo "warmup $i launched $(($(now) - start))"',
+            '        else left="$left $i"; fi',
+            "    done",
+            '    pending="$left"',
+            f'    [ -n "$pending" ] && sleep {self.interval}',
+            "done",
+            'for i in $pending; do echo "warmup $i timeout $(($(now) - start))"; done',
+            "true",
+        ]
+        # instance.bash shares its shell with the model's bash tool, so keep
+        # the functions and variables above out of it
+        return "(\n" + "\n".join(lines) + "\n)"
+
+    def run(self, instance) -> WarmupReport:
+        """Launch the apps and wait for their windows, at most `timeout` seconds."""
+        report = WarmupReport()
+        if not self.apps:
+            return report
+        started = time.perf_counter()
+        try:
+            result = instance.bash(command=self.script()) or {}
+            output = result.get("output") or ""
+        except Exception as e:
+            print(f"Warmup failed: {e}")
+            output = ""
+        statuses = {}
+        for i, status, ms in re.findall(r"^warmup (\d+) (\w+) (\d+)$", output, re.M):
+            # An app found open before launch also shows up in the poll
+            statuses.setdefault(int(i), (status, int(ms) / 1000))
+        for i, app in enumerate(self.apps):
+            status, seconds = statuses.get(i, ("timeout", self.timeout))
+            report.apps.append(AppResult(app.name, status, seconds))
+        report.seconds = time.perf_counter() - started
+        return report
+
+
+def parse_apps(names: List[str]) -> List[App]:
+    """Apps for `--warmup` values: names from APPS, or NAME=COMMAND with the
+    window matched by the command's name."""
+    apps = []
+    for name in names:
+        if name in APPS:
+            apps.append(APPS[name])
+        elif "=" in name:
+            label, command = name.split("=", 1)
+            window = shlex.split(command)[0].rsplit("/", 1)[-1]
+            apps.append(App(label, command, f"--class {shlex.quote(window)}"))
+        else:
+            raise ValueError(
+                f"Unknown app {name!r}, use one of {', '.join(APPS)} or NAME=COMMAND"
+            )
+    return apps
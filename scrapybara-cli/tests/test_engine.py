@@ -0,0 +1,119 @@
+import asyncio
+from types import SimpleNamespace as Event
+
+from scrapybara.anthropic.base import ToolResult
+
+from src.engine import AgentLoop, TurnStats
+from src.helpers import ToolCollection
+
+
+class EchoTool:
+    def __init__(self):
+        self.calls = []
+
+    def to_params(self) -> dict:
+        return {"name": "echo", "type": "custom"}
+
+    async def __call__(self, **tool_input) -> ToolResult:
+        self.calls.append(tool_input)
+        return ToolResult(output=str(tool_input))
+
+
+class FakeMessages:
+    def __init__(self, events: list):
+        self.events = events
+
+    async def create(self, **kwargs):
+        async def stream():
+            for event in self.events:
+                yield event
+
+        return stream()
+
+
+def fake_client(events: list):
+    return Event(beta=Event(messages=FakeMessages(events)))
+
+
+def message_start():
+    usage = Event(
+        input_tokens=10, cache_read_input_tokens=0, cache_creation_input_tokens=0
+    )
+    return Event(type="message_start", message=Event(usage=usage))
+
+
+def tool_call(index: int, tool_id: str, partial_json: str) -> list:
+    return [
+        Event(
+            type="content_block_start",
+            index=index,
+            content_block=Event(type="tool_use", id=tool_id, name="echo"),
+        ),
+        Event(
+            type="content_block_delta",
+            index=index,
+            delta=Event(type="input_json_delta", partial_json=partial_json),
+        ),
+        Event(type="content_block_stop", index=index),
+    ]
+
+
+def message_delta(stop_reason: str):
+    return Event(
+        type="message_delta",
+        delta=Event(stop_reason=stop_reason),
+        usage=Event(output_tokens=5),
+    )
+
+
+def step(events: list, tool: EchoTool):
+    loop = AgentLoop(fake_client(events), ToolCollection(tool), "system")
+    turn = TurnStats(turn=1)
+    blocks, tool_results = asyncio.run(loop.step([], [], [], turn))
+    return blocks, tool_results, turn
+
+
+def test_tool_call_cut_off_at_max_tokens_is_reported():
+    tool = EchoTool()
+    events = [
+        message_start(),
+        *tool_call(0, "complete", '{"text": "hi"}'),
+        *tool_call(1, "cut", '{"text": "unfinish'),
+        message_delta("max_tokens"),
+    ]
+
+    blocks, tool_results, turn = step(events, tool)
+
+    assert tool.calls == [{"text": "hi"}]
+    assert turn.stop_reason == "max_tokens"
+    assert [block["id"] for block in blocks] == ["complete", "cut"]
+    assert [result["tool_use_id"] for result in tool_results] == ["complete", "cut"]
+    assert not tool_results[0]["is_error"]
+    assert tool_results[1]["is_error"]
+    assert "max_tokens" in tool_results[1]["content"]
+
+
+def test_unregistered_block_types_are_ignored():
+    tool = EchoTool()
+    events = [
+        message_start(),
+        Event(
+            type="content_block_start",
+            index=0,
+            content_block=Event(type="thinking"),
+        ),
+        Event(
+            type="content_block_delta",
+            index=0,
+            delta=Event(type="thinking_delta", thinking="hmm"),
+        ),
+        Event(type="content_block_stop", index=0),
+        *tool_call(1, "call", "{}"),
+        message_delta("tool_use"),
+    ]
+
+    blocks, tool_results, turn = step(events, tool)
+
+    assert [block["type"] for block in blocks] == ["tool_use"]
+    assert tool.calls == [{}]
+    assert len(tool_results) == 1
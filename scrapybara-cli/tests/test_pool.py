@@ -0,0 +1,158 @@
+import os
+import subprocess
+import threading
+
+import pytest
+
+from src.pool import RESET_COMMAND, FakeClient, InstancePool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def no_host_commands(monkeypatch):
+    # RESET_COMMAND wipes /tmp; make sure nothing hands it to the host shell
+    def refuse(*args, **kwargs):
+        raise AssertionError(f"pool tried to run a host command: {args}")
+
+    monkeypatch.setattr(os, "system", refuse)
+    monkeypatch.setattr(subprocess, "Popen", refuse)
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / "pool.json")
+
+
+def make_pool(client, state_path, clock, **kwargs) -> InstancePool:
+    return InstancePool(client, state_path=state_path, clock=clock, **kwargs)
+
+
+def test_lease_reuses_idle_instance(client, state_path, clock):
+    pool = make_pool(client, state_path, clock)
+    first = pool.lease("small")
+    pool.release(first)
+
+    second = pool.lease("small")
+
+    assert second is first
+    assert client.started == 1
+    assert pool.idle("small") == []
+
+
+def test_lease_starts_instance_when_none_idle(client, state_path, clock):
+    pool = make_pool(client, state_path, clock, size=2)
+    first = pool.lease("small")
+    second = pool.lease("small")
+
+    assert first is not second
+    assert client.started == 2
+
+
+def test_release_runs_reset_command(client, state_path, clock):
+    pool = make_pool(client, state_path, clock)
+    instance = pool.lease("small")
+
+    pool.release(instance)
+
+    assert instance.commands == [RESET_COMMAND]
+    assert instance.status == "running"
+    assert pool.idle("small") == [instance.id]
+
+
+def test_release_stops_instance_when_pool_full(client, state_path, clock):
+    pool = make_pool(client, state_path, clock, size=1)
+    pooled = pool.lease("small")
+    extra = pool.lease("small")
+
+    pool.release(extra)
+    pool.release(pooled)
+
+    assert extra.status == "terminated"
+    assert pool.idle("small") == [pooled.id]
+
+
+def test_fill_tops_up_to_size(client, state_path, clock):
+    pool = make_pool(client, state_path, clock, size=3)
+    leased = pool.lease("small")
+
+    assert pool.fill("small") == 2
+    assert pool.fill("small") == 0
+    assert client.started == 3
+    assert len(pool.idle("small")) == 2
+    assert leased.id not in pool.idle("small")
+
+
+def test_reap_stops_instances_past_ttl(client, state_path, clock):
+    pool = make_pool(client, state_path, clock, size=2, ttl=60)
+    pool.fill("small")
+    clock.now += 30
+    assert pool.reap() == 0
+
+    clock.now += 31
+    assert pool.reap() == 2
+    assert pool.idle("small") == []
+    assert all(i.status == "terminated" for i in client.instances.values())
+
+
+def test_reap_stops_instances_near_their_timeout(client, state_path, clock):
+    pool = make_pool(
+        client, state_path, clock, ttl=24 * 3600, timeout_hours=1, min_remaining=600
+    )
+    pool.fill("small")
+    clock.now += 3600 - 599
+
+    assert pool.reap() == 1
+
+
+def test_pools_sharing_a_state_file(client, state_path, clock):
+    pools = [make_pool(client, state_path, clock, size=2) for _ in range(2)]
+    threads = [
+        threading.Thread(target=pool.fill, args=("small",))
+        for pool in pools
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.started == 2
+    assert sorted(pools[0].idle("small")) == sorted(pools[1].idle("small"))
+
+    leased = [pool.lease("small") for pool in pools]
+    assert leased[0] is not leased[1]
+    assert client.started == 2
+    assert pools[0].idle("small") == []
+
+
+def test_state_file_lock_blocks_other_pools(client, state_path, clock):
+    holder, other = [make_pool(client, state_path, clock) for _ in range(2)]
+    filled = threading.Event()
+    thread = threading.Thread(
+        target=lambda: (other.fill("small"), filled.set()), daemon=True
+    )
+
+    with holder._state():
+        thread.start()
+        assert not filled.wait(0.2)
+    thread.join(5)
+
+    assert filled.is_set()
+    assert holder.idle("small") == other.idle("small") == ["fake-1"]
@@ -0,0 +1,16 @@
+import importlib.util
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parents[2] / "sync_shared.py"
+
+
+def test_demo_copies_match_source():
+    spec = importlib.util.spec_from_file_location("sync_shared", SCRIPT)
+    sync_shared = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sync_shared)
+
+    stale = [
+        str(path.relative_to(sync_shared.ROOT)) for path in sync_shared.stale_copies()
+    ]
+
+    assert stale == [], "run `python sync_shared.py` from the repository root"
@@ -0,0 +1,64 @@
+"""Copy the agent modules the demos share from scrapybara-cli into each demo.
+
+Each demo is a standalone project, installed and run from its own directory
+with its own lock file, so it keeps its own copy of these modules instead of
+depending on scrapybara-cli. The copies in scrapybara-cli/src are the ones to
+edit; run `python sync_shared.py` afterwards to update the demos, or
+`python sync_shared.py --check` to list the copies that differ.
+"""
+
+import re
+import sys
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent
+SOURCE = ROOT / "scrapybara-cli" / "src"
+SHARED = {
+    "dungeon-crawler": [
+        "checkpoint",
+        "engine",
+        "helpers",
+        "history",
+        "images",
+        "pool",
+        "provision",
+        "warmup",
+    ],
+    "website-copycat": ["engine", "helpers", "history", "images", "pool"],
+}
+
+
+def demo_copy(module: str) -> str:
+    """A module's source as a demo holds it, with absolute imports of its siblings."""
+    source = (SOURCE / f"{module}.py").read_text()
+    return re.sub(r"^from \.(\w+) import", r"from \1 import", source, flags=re.M)
+
+
+def stale_copies() -> List[Path]:
+    """Demo copies that differ from scrapybara-cli/src."""
+    stale = []
+    for demo, modules in SHARED.items():
+        for module in modules:
+            path = ROOT / demo / f"{module}.py"
+            if not path.exists() or path.read_text() != demo_copy(module):
+                stale.append(path)
+    return stale
+
+
+def sync() -> List[Path]:
+    """Rewrite the stale demo copies. Returns the paths written."""
+    stale = stale_copies()
+    for path in stale:
+        path.write_text(demo_copy(path.stem))
+    return stale
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv[1:]:
+        stale = stale_copies()
+        for path in stale:
+            print(f"{path.relative_to(ROOT)} differs from scrapybara-cli/src")
+        sys.exit(1 if stale else 0)
+    for path in sync():
+        print(f"Updated {path.relative_to(ROOT)}")
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Optional, Type, TypeVar
+from pydantic import BaseModel
+
+T = TypeVar("T", bound=BaseModel)
+
+DEFAULT_CACHE_PATH = ".w25-cache.sqlite"
+
+
+def cache_key(prompt: str, schema: Type[BaseModel], target: str = "") -> str:
+    """Key for an act call's structured output: its prompt, output schema and target."""
+    payload = json.dumps(
+        [prompt, schema.model_json_schema(), target], sort_keys=True
+    ).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+class ResultCache:
+    """SQLite cache of structured `client.act` outputs.
+
+    Entries older than `ttl` seconds are ignored unless a lookup asks for
+    `ignore_ttl`, which is how an interrupted run is resumed. Values are
+    stored as the schema's JSON and validated again on the way out.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = 24 * 60 * 60):
+        self.path = path
+        self.ttl = ttl
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    def get(self, key: str, schema: Type[T], ignore_ttl: bool = False) -> Optional[T]:
+        row = self.db.execute(
+            "SELECT value, created_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        value, created_at = row
+        if not ignore_ttl and time.time() - created_at > self.ttl:
+            return None
+        return schema.model_validate_json(value)
+
+    def put(self, key: str, value: BaseModel) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)",
+            (key, value.model_dump_json(), time.time()),
+        )
+        self.db.commit()
+
+    def purge(self) -> int:
+        """Delete expired entries. Returns how many."""
+        cursor = self.db.execute(
+            "DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl,)
+        )
+        self.db.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self.db.close()
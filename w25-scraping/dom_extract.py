@@ -0,0 +1,97 @@
+import time
+from typing import List, Optional
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright
+
+W25_URL = "https://www.ycombinator.com/companies?batch=Winter%202025"
+
+# The directory's class names carry a build hash (e.g. "_coName_i9oky_470"),
+# so match on the readable part only
+CARD_SELECTOR = 'a[href^="/companies/"]:has([class*="coName"])'
+
+EXTRACT_CARDS_JS = """
+(cards) => cards.map((card) => {
+    const text = (selector) => {
+        const el = card.querySelector(selector);
+        return el ? el.textContent.trim() : "";
+    };
+    return {
+        name: text('[class*="coName"]'),
+        description: text('[class*="coDescription"]'),
+        tags: Array.from(card.querySelectorAll('[class*="pill"]'))
+            .map((el) => el.textContent.trim())
+            .filter((tag) => tag.length > 0),
+    };
+})
+"""
+
+
+class ExtractionError(Exception):
+    """The page didn't look like the company directory the selectors expect."""
+
+
+async def scroll_to_end(
+    page: Page, max_seconds: float = 120, settle_ms: int = 1500, idle_rounds: int = 3
+) -> int:
+    """Scroll until no new company cards load. Returns the number of cards."""
+    deadline = time.monotonic() + max_seconds
+    count = -1
+    idle = 0
+    while idle < idle_rounds and time.monotonic() < deadline:
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        await page.wait_for_timeout(settle_ms)
+        new_count = await page.locator(CARD_SELECTOR).count()
+        idle = idle + 1 if new_count == count else 0
+        count = new_count
+    return count
+
+
+async def extract_companies(page: Page) -> List[dict]:
+    """Parse every company card on the page into name/description/tags dicts."""
+    cards = await page.eval_on_selector_all(CARD_SELECTOR, EXTRACT_CARDS_JS)
+    if not cards:
+        raise ExtractionError("No company cards found")
+    if any(not card["name"] for card in cards):
+        raise ExtractionError("Company cards without a name, the selectors are stale")
+    return cards
+
+
+async def scrape_companies(
+    cdp_url: str, url: Optional[str] = W25_URL, html: Optional[str] = None
+) -> List[dict]:
+    """Scrape the directory through the browser's CDP endpoint, without the agent.
+
+    Loads `url` and scrolls through the whole list, or parses `html` (a saved
+    copy of the page) as is. Raises ExtractionError when the cards can't be
+    parsed so the caller can fall back to the agent.
+    """
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.connect_over_cdp(cdp_url)
+        context = (
+            browser.contexts[0] if browser.contexts else await browser.new_context()
+        )
+        page = await context.new_page()
+        try:
+            if html is not None:
+                await page.set_content(html)
+            else:
+                await page.goto(url)
+                try:
+                    await page.wait_for_selector(CARD_SELECTOR, timeout=30000)
+                except PlaywrightTimeoutError:
+                    raise ExtractionError("No company cards appeared")
+                await scroll_to_end(page)
+            return await extract_companies(page)
+        finally:
+            await page.close()
+
+
+async def open_html(cdp_url: str, html: str) -> None:
+    """Show `html` in the browser's visible tab, e.g. for the agent to read."""
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.connect_over_cdp(cdp_url)
+        context = (
+            browser.contexts[0] if browser.contexts else await browser.new_context()
+        )
+        page = context.pages[0] if context.pages else await context.new_page()
+        await page.set_content(html)
@@ -3,12 +3,19 @@ from scrapybara.anthropic import Anthropic
 from scrapybara.tools import BashTool, ComputerTool, EditTool, BrowserTool
 from scrapybara.prompts import BROWSER_UBUNTU_UBUNTU_SYSTEM_PROMPT
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from dotenv import load_dotenv
+import argparse
+import asyncio
 import os
+import time
+from cache import DEFAULT_CACHE_PATH, ResultCache, cache_key
+from dom_extract import ExtractionError, open_html, scrape_companies
 
 load_dotenv()
 
+COMPANIES_PROMPT = "Go to https://ycombinator.com/companies, set batch filter to W25, and scrape all W25 companies, don't evaluate any code, just look at the HTML and return structured data."
+
 
 # Define schemas for structured output
 class Company(BaseModel):
@@ -26,71 +33,328 @@ class ContactInfo(BaseModel):
     contact_details: str
 
 
-def handle_step(step):
-    print(f"\nStep output: {step.text}")
+def handle_step(step, prefix=""):
+    print(f"\n{prefix}Step output: {step.text}")
     if step.tool_calls:
         for call in step.tool_calls:
-            print(f"Tool used: {call.tool_name}")
+            print(f"{prefix}Tool used: {call.tool_name}")
     if step.usage:
-        print(f"Tokens used: {step.usage.total_tokens}")
+        print(f"{prefix}Tokens used: {step.usage.total_tokens}")
+
+
+def contact_prompt(company: Company) -> str:
+    return f"Go to https://ycombinator.com/companies and find the best way to contact YC W25 company {company.name} - {company.description}. Try their website, LinkedIn, and Twitter/X."
+
+
+def make_tools(instance):
+    return [
+        BashTool(instance),
+        ComputerTool(instance),
+        EditTool(instance),
+        BrowserTool(instance),
+    ]
+
+
+def find_contact(client, model, instance, company: Company) -> ContactInfo:
+    """Run one contact lookup on `instance`. Blocks until the agent finishes."""
+    response = client.act(
+        model=model,
+        tools=make_tools(instance),
+        system=BROWSER_UBUNTU_UBUNTU_SYSTEM_PROMPT,
+        prompt=contact_prompt(company),
+        schema=ContactInfo,
+        on_step=lambda step: handle_step(step, prefix=f"[{company.name}] "),
+    )
+    return response.output
+
+
+async def find_contacts(
+    client,
+    model,
+    instances: list,
+    companies: List[Company],
+    timeout: float,
+    cache: Optional[ResultCache] = None,
+) -> List[Optional[ContactInfo]]:
+    """Look up contact info for every company, one worker per browser instance.
+
+    Each lookup has its own timeout and failures don't affect the other
+    companies. A lookup that times out keeps running in its thread, so its
+    browser is stopped and replaced in `instances`. If no replacement can be
+    started, that worker stops and its browser is removed from `instances`,
+    leaving the rest of the queue to the other workers. Results are printed as
+    they complete and returned in the original order, with None for companies
+    that failed. Successful lookups are saved to `cache` as soon as they finish.
+    """
+    queue = asyncio.Queue()
+    for i, company in enumerate(companies):
+        queue.put_nowait((i, company))
+    results: List[Optional[ContactInfo]] = [None] * len(companies)
+    done = 0
+    started = time.perf_counter()
+
+    async def worker(slot: int):
+        nonlocal done
+        while not queue.empty():
+            i, company = queue.get_nowait()
+            print(f"\nFinding contact info for {company.name}...")
+            try:
+                results[i] = await asyncio.wait_for(
+                    asyncio.to_thread(
+                        find_contact, client, model, instances[slot], company
+                    ),
+                    timeout,
+                )
+                print(f"\nFound contact info for {company.name}: {results[i]}")
+                if cache:
+                    cache.put(
+                        cache_key(contact_prompt(company), ContactInfo, company.name),
+                        results[i],
+                    )
+            except asyncio.TimeoutError:
+                print(f"\nTimed out finding contact info for {company.name}")
+                old = instances[slot]
+                try:
+                    instances[slot] = await asyncio.to_thread(
+                        client.start_browser, timeout_hours=1
+                    )
+                except Exception as e:
+                    print(
+                        f"\nCould not replace browser {slot + 1}, "
+                        f"stopping its worker: {e}"
+                    )
+                    instances[slot] = None
+                try:
+                    await asyncio.to_thread(old.stop)
+                except Exception as e:
+                    print(f"\nCould not stop timed out browser {slot + 1}: {e}")
+            except Exception as e:
+                print(f"\nFailed to find contact info for {company.name}: {e}")
+            done += 1
+            print(
+                f"{done}/{len(companies)} companies done in "
+                f"{time.perf_counter() - started:.0f}s"
+            )
+            if instances[slot] is None:
+                return
+
+    await asyncio.gather(*(worker(slot) for slot in range(len(instances))))
+    instances[:] = [instance for instance in instances if instance is not None]
+    # Left over if every worker lost its browser
+    while not queue.empty():
+        i, company = queue.get_nowait()
+        print(f"\nFailed to find contact info for {company.name}: no browser left")
+    return results
+
+
+def scrape_with_agent(
+    client, model, instance, prompt: str = COMPANIES_PROMPT
+) -> Companies:
+    response = client.act(
+        model=model,
+        tools=make_tools(instance),
+        system=BROWSER_UBUNTU_UBUNTU_SYSTEM_PROMPT,
+        prompt=prompt,
+        schema=Companies,
+        on_step=handle_step,
+    )
+    return response.output
+
+
+def scrape_directory(client, model, instance) -> Companies:
+    """Read the companies straight from the page's DOM, falling back to the agent."""
+    try:
+        cards = asyncio.run(scrape_companies(instance.get_cdp_url().cdp_url))
+        return Companies(companies=[Company(**card) for card in cards])
+    except ExtractionError as e:
+        print(f"DOM extraction failed ({e}), asking the agent instead")
+        return scrape_with_agent(client, model, instance)
+
+
+def benchmark(client, model, instance, html_path: str) -> None:
+    """Time the DOM extractor against the agent on a saved copy of the directory page."""
+    with open(html_path) as f:
+        html = f.read()
+    cdp_url = instance.get_cdp_url().cdp_url
+
+    started = time.perf_counter()
+    try:
+        cards = asyncio.run(scrape_companies(cdp_url, html=html))
+        print(
+            f"DOM extraction: {len(cards)} companies in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+    except ExtractionError as e:
+        print(
+            f"DOM extraction failed after {time.perf_counter() - started:.1f}s: {e}"
+        )
 
+    asyncio.run(open_html(cdp_url, html))
+    started = time.perf_counter()
+    scraped = scrape_with_agent(
+        client,
+        model,
+        instance,
+        "The page open in the browser is a saved copy of the YC W25 company directory. Don't navigate away from it. Scrape all companies on it, don't evaluate any code, just look at the HTML and return structured data.",
+    )
+    print(
+        f"Agent: {len(scraped.companies)} companies in "
+        f"{time.perf_counter() - started:.1f}s"
+    )
 
-def main():
+
+async def start_workers(client, instances: list, workers: int) -> None:
+    """Start browser instances until there are `workers` of them."""
+    instances.extend(
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(client.start_browser, timeout_hours=1)
+                for _ in range(workers - len(instances))
+            )
+        )
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Scrape YC W25 companies and find a way to contact each one"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="browser instances to look up contact info on in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=3,
+        help="only look up the first N companies, 0 for all of them (default: 3)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=600,
+        help="seconds to allow for each company's lookup (default: 600)",
+    )
+    parser.add_argument(
+        "--cache",
+        default=DEFAULT_CACHE_PATH,
+        help=f"SQLite file scraped companies and contact info are cached in (default: {DEFAULT_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=24,
+        help="hours cached results stay valid (default: 24)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the last run: reuse its companies and completed lookups however old they are",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="ignore cached results and scrape everything again",
+    )
+    parser.add_argument(
+        "--benchmark",
+        metavar="HTML",
+        help="time the DOM extractor against the agent on a saved copy of the directory page, then exit",
+    )
+    parser.add_argument(
+        "--no-draft",
+        action="store_true",
+        help="stop after the contact lookups instead of drafting messages in LibreOffice",
+    )
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
     # Load the API key from the environment variable
     api_key = os.getenv("SCRAPYBARA_API_KEY")
     if not api_key:
         raise ValueError("API key not found. Please set the SCRAPYBARA_API_KEY in your .env file.")
     
     client = Scrapybara(api_key=api_key)
+    model = Anthropic()
+    cache = ResultCache(args.cache, ttl=args.cache_ttl * 60 * 60)
+
+    # Browser instances, started when first needed. The first one is the
+    # main browser, the rest are extra contact lookup workers
+    instances = []
 
-    # Start the browser instance
-    instance = client.start_browser(timeout_hours=1)
+    def main_browser():
+        if not instances:
+            asyncio.run(start_workers(client, instances, 1))
+            print(f"Access the browser at: {instances[0].get_stream_url().stream_url}")
+        return instances[0]
 
     try:
-        # Print the stream URL
-        stream_url = instance.get_stream_url().stream_url
-        print(f"Access the browser at: {stream_url}")
-
-        # Set up tools and model
-        tools = [
-            BashTool(instance),
-            ComputerTool(instance),
-            EditTool(instance),
-            BrowserTool(instance),
-        ]
-        model = Anthropic()
+        if args.benchmark:
+            benchmark(client, model, main_browser(), args.benchmark)
+            return
 
         # 2. Scrape W25 companies
-        companies_response = client.act(
-            model=model,
-            tools=tools,
-            system=BROWSER_UBUNTU_UBUNTU_SYSTEM_PROMPT,
-            prompt="Go to https://ycombinator.com/companies, set batch filter to W25, and scrape all W25 companies, don't evaluate any code, just look at the HTML and return structured data.",
-            schema=Companies,
-            on_step=handle_step,
-        )
-        print(f"\nScraped W25 companies: {companies_response.output.companies}")
+        companies_key = cache_key(COMPANIES_PROMPT, Companies)
+        scraped = None
+        if not args.refresh:
+            scraped = cache.get(companies_key, Companies, ignore_ttl=args.resume)
+        if scraped:
+            print(f"\nUsing cached W25 companies: {scraped.companies}")
+        else:
+            scraped = scrape_directory(client, model, main_browser())
+            cache.put(companies_key, scraped)
+            print(f"\nScraped W25 companies: {scraped.companies}")
 
-        COMPANY_LIMIT = 3
-        companies = companies_response.output.companies[:COMPANY_LIMIT]
+        companies = scraped.companies
+        if args.limit:
+            companies = companies[: args.limit]
 
-        # 3. Find best way to contact each company
-        for company in companies:
-            print(f"\nFinding contact info for {company.name}...")
-            contact_response = client.act(
-                model=model,
-                tools=tools,
-                system=BROWSER_UBUNTU_UBUNTU_SYSTEM_PROMPT,
-                prompt=f"Go to https://ycombinator.com/companies and find the best way to contact YC W25 company {company.name} - {company.description}. Try their website, LinkedIn, and Twitter/X.",
-                schema=ContactInfo,
-                on_step=handle_step,
+        # 3. Find best way to contact each company, skipping the ones already done
+        contacts = [
+            None
+            if args.refresh
+            else cache.get(
+                cache_key(contact_prompt(company), ContactInfo, company.name),
+                ContactInfo,
+                ignore_ttl=args.resume,
             )
-            print(f"\nFound contact info for {company.name}: {contact_response.output}")
+            for company in companies
+        ]
+        pending = [i for i, contact in enumerate(contacts) if contact is None]
+        for company, contact in zip(companies, contacts):
+            if contact:
+                print(f"Using cached contact info for {company.name}: {contact}")
+
+        if pending:
+            asyncio.run(
+                start_workers(client, instances, min(args.workers, len(pending)))
+            )
+            found = asyncio.run(
+                find_contacts(
+                    client,
+                    model,
+                    instances,
+                    [companies[i] for i in pending],
+                    args.timeout,
+                    cache,
+                )
+            )
+            for i, contact in zip(pending, found):
+                contacts[i] = contact
+        found = sum(contact is not None for contact in contacts)
+        print(f"\nFound contact info for {found} of {len(companies)} companies")
+
+        if args.no_draft:
+            return
 
-        # 4. Draft messages for every company
+        # 4. Draft messages for every company (a timed out lookup may have
+        # replaced the main browser, so look it up again)
         client.act(
             model=model,
-            tools=tools,
+            tools=make_tools(main_browser()),
             system=BROWSER_UBUNTU_UBUNTU_SYSTEM_PROMPT,
             prompt=f"Open LibreOffice, draft a two sentence message to each of the following YC W25 companies, advertising a capybara zoo in Japan: {companies}",
             on_step=handle_step,
@@ -99,8 +363,10 @@ def main():
 
     finally:
         # 5. Clean up
-        instance.stop()
+        for instance in instances:
+            instance.stop()
+        cache.close()
 
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin, urlparse
+import httpx
+
+CSS_URL_PATTERN = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+# <link rel=...> values whose href is something the page renders with
+ASSET_LINK_RELS = {"stylesheet", "icon", "shortcut", "apple-touch-icon", "preload"}
+MAX_ASSET_BYTES = 10 * 1024 * 1024
+EXTENSIONS = {
+    "text/css": ".css",
+    "image/svg+xml": ".svg",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/x-icon": ".ico",
+    "font/woff2": ".woff2",
+    "font/woff": ".woff",
+}
+
+
+class _PageLinks(HTMLParser):
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links: list[str] = []
+        self.assets: list[str] = []
+        self.in_style = False
+
+    def add_asset(self, url: str) -> None:
+        url = url.strip()
+        if url and not url.startswith(("data:", "blob:", "javascript:")):
+            self.assets.append(urldefrag(urljoin(self.base_url, url)).url)
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href"):
+            self.base_url = urljoin(self.base_url, attrs["href"])
+        elif tag == "a" and attrs.get("href"):
+            self.links.append(urldefrag(urljoin(self.base_url, attrs["href"])).url)
+        elif tag == "link" and attrs.get("href"):
+            if ASSET_LINK_RELS & set((attrs.get("rel") or "").lower().split()):
+                self.add_asset(attrs["href"])
+        elif tag in ("img", "source", "video", "input"):
+            for name in ("src", "poster"):
+                if attrs.get(name):
+                    self.add_asset(attrs[name])
+            if attrs.get("srcset"):
+                # The first candidate is enough for a replica
+                self.add_asset(attrs["srcset"].split(",")[0].split()[0])
+        elif tag == "style":
+            self.in_style = True
+        if attrs.get("style"):
+            for _, url in CSS_URL_PATTERN.findall(attrs["style"]):
+                self.add_asset(url)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "style":
+            self.in_style = False
+
+    def handle_data(self, data: str) -> None:
+        if self.in_style:
+            for _, url in CSS_URL_PATTERN.findall(data):
+                self.add_asset(url)
+
+
+def page_links(html: str, base_url: str) -> tuple[list[str], list[str]]:
+    """(links, assets) of a page: absolute URLs of its <a> targets, and of the
+    images, stylesheets, icons and fonts it renders with, each without duplicates."""
+    parser = _PageLinks(base_url)
+    parser.feed(html)
+    parser.close()
+    return list(dict.fromkeys(parser.links)), list(dict.fromkeys(parser.assets))
+
+
+def same_site(url: str, start_url: str) -> bool:
+    """Whether `url` is an http(s) page on the same host as `start_url`."""
+    parsed = urlparse(url)
+    strip = lambda host: (host or "").lower().removeprefix("www.")
+    return parsed.scheme in ("http", "https") and strip(parsed.hostname) == strip(
+        urlparse(start_url).hostname
+    )
+
+
+def page_slug(url: str) -> str:
+    """A file name for a crawled page, e.g. /companies/airbnb -> companies-airbnb."""
+    parsed = urlparse(url)
+    path = parsed.path + (f"-{parsed.query}" if parsed.query else "")
+    return re.sub(r"[^a-zA-Z0-9]+", "-", path).strip("-").lower() or "index"
+
+
+@dataclass
+class AssetCacheStats:
+    hits: int = 0
+    downloads: int = 0
+    failures: int = 0
+    bytes_downloaded: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"Assets: {self.downloads} downloaded "
+            f"({self.bytes_downloaded // 1024} KB), {self.hits} reused, "
+            f"{self.failures} failed"
+        )
+
+
+class AssetCache:
+    """Content-addressed store of page assets, shared by every page of a crawl.
+
+    Each asset is downloaded once and stored under the sha256 of its
+    content, so an image referenced by many pages (or by several URLs) is
+    kept once. `index.json` maps URLs to stored files, which makes the cache
+    carry over between runs. Concurrent requests for the same URL share one
+    download. Stylesheets are stored with their url() references rewritten
+    to the cached files, so fonts and background images load from the cache
+    too.
+    """
+
+    def __init__(self, root: str = "~/.cache/website-copycat/assets"):
+        self.root = os.path.expanduser(root)
+        self.index_path = os.path.join(self.root, "index.json")
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            with open(self.index_path) as f:
+                self.index: dict = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+        self.pending: dict = {}
+        self.rewriting: set = set()
+        self.stats = AssetCacheStats()
+        self.client = httpx.AsyncClient(follow_redirects=True, timeout=20)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def with_dependencies(self, names) -> set[str]:
+        """`names` plus the cached files their stylesheets refer to, recursively."""
+        found = set()
+        todo = list(names)
+        while todo:
+            name = todo.pop()
+            if name in found:
+                continue
+            found.add(name)
+            if name.endswith(".css"):
+                with open(self.path(name), errors="replace") as f:
+                    todo += [
+                        url
+                        for _, url in CSS_URL_PATTERN.findall(f.read())
+                        if os.path.exists(self.path(url))
+                    ]
+        return found
+
+    async def fetch(self, url: str) -> str | None:
+        """File name of the cached asset at `url`, downloading it if needed."""
+        name = self.index.get(url)
+        if name and os.path.exists(self.path(name)):
+            self.stats.hits += 1
+            return name
+        if url in self.pending:
+            self.stats.hits += 1
+            return await self.pending[url]
+
+        self.pending[url] = asyncio.ensure_future(self._download(url))
+        try:
+            return await self.pending[url]
+        finally:
+            self.pending.pop(url, None)
+
+    async def fetch_all(self, urls: list[str]) -> dict:
+        """{url: file name} for those of `urls` that could be fetched."""
+        names = await asyncio.gather(*(self.fetch(url) for url in urls))
+        return {url: name for url, name in zip(urls, names) if name}
+
+    async def _download(self, url: str) -> str | None:
+        try:
+            response = await self.client.get(url)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Could not fetch {url}: {e}")
+            self.stats.failures += 1
+            return None
+        data = response.content
+        if len(data) > MAX_ASSET_BYTES:
+            self.stats.failures += 1
+            return None
+        self.stats.downloads += 1
+        self.stats.bytes_downloaded += len(data)
+
+        content_type = response.headers.get("content-type", "").split(";")[0].strip()
+        if content_type == "text/css":
+            self.rewriting.add(url)
+            try:
+                css = await self._rewrite_css(data.decode(errors="replace"), url)
+            finally:
+                self.rewriting.discard(url)
+            data = css.encode()
+
+        extension = (
+            EXTENSIONS.get(content_type)
+            or mimetypes.guess_extension(content_type)
+            or os.path.splitext(urlparse(url).path)[1][:8]
+        )
+        name = hashlib.sha256(data).hexdigest() + extension
+        if not os.path.exists(self.path(name)):
+            tmp_path = self.path(name) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(name))
+        self.index[url] = name
+        return name
+
+    async def _rewrite_css(self, css: str, css_url: str) -> str:
+        urls = [
+            urljoin(css_url, url)
+            for _, url in CSS_URL_PATTERN.findall(css)
+            if not url.startswith("data:")
+        ]
+        # Stylesheets importing each other would wait on one another forever
+        urls = [url for url in urls if url not in self.rewriting]
+        names = await self.fetch_all(list(dict.fromkeys(urls)))
+
+        def replace(match: re.Match) -> str:
+            name = names.get(urljoin(css_url, match.group(2)))
+            # Cached files sit next to each other, so a bare name resolves
+            return f"url({name})" if name else match.group(0)
+
+        return CSS_URL_PATTERN.sub(replace, css)
+
+    async def close(self) -> None:
+        """Save the index and close the HTTP client."""
+        await self.client.aclose()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,171 @@
+import asyncio
+import re
+import time
+from typing import Optional, Tuple
+from anthropic.types.beta import BetaToolResultBlockParam
+from scrapybara.anthropic.base import ToolError, ToolFailure, ToolResult
+from images import ScreenshotProcessor
+
+CURSOR_POSITION_PATTERN = re.compile(r"X=(\d+),Y=(\d+)")
+
+
+class ToolCollection:
+    def __init__(self, *tools, processor: Optional[ScreenshotProcessor] = None):
+        self.tools = tools
+        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
+        self.processor = processor or ScreenshotProcessor()
+
+    @property
+    def display_size(self) -> Optional[Tuple[int, int]]:
+        computer = self.tool_map.get("computer")
+        if not computer:
+            return None
+        params = computer.to_params()
+        return params["display_width_px"], params["display_height_px"]
+
+    def to_params(self) -> list:
+        params = [tool.to_params() for tool in self.tools]
+        if self.display_size:
+            # Claude sees the processed screenshots, so advertise their size
+            width, height = self.processor.target_size(*self.display_size)
+            params = [
+                (
+                    {**p, "display_width_px": width, "display_height_px": height}
+                    if p["name"] == "computer"
+                    else p
+                )
+                for p in params
+            ]
+        return params
+
+    async def run(self, *, name: str, tool_input: dict) -> ToolResult:
+        """Run a tool. Failures come back as a ToolFailure for Claude to see instead of raising."""
+        tool = self.tool_map.get(name)
+        if not tool:
+            return ToolFailure(error=f"Tool {name} is not available")
+        if name == "computer" and tool_input.get("coordinate"):
+            tool_input = {
+                **tool_input,
+                "coordinate": self.processor.to_display(
+                    tool_input["coordinate"], self.display_size
+                ),
+            }
+        try:
+            result = await tool(**tool_input)
+        except ToolError as e:
+            return ToolFailure(error=e.message)
+        except Exception as e:
+            print(f"Error running tool {name}: {e}")
+            return ToolFailure(error=f"Error running tool {name}: {e}")
+        if (
+            name == "computer"
+            and tool_input.get("action") == "cursor_position"
+            and result.output
+        ):
+            match = CURSOR_POSITION_PATTERN.search(result.output)
+            if match:
+                x, y = self.processor.to_screenshot(
+                    [int(match[1]), int(match[2])], self.display_size
+                )
+                result = result.replace(output=f"X={x},Y={y}")
+        return result
+
+    def is_parallel_safe(self, name: str, tool_input: dict) -> bool:
+        """Whether a call leaves the display and filesystem alone, so it can overlap other safe calls.
+
+        Only file views qualify. Every bash call runs in the one shell session
+        the instance keeps, so even read-only commands stay serial, along with
+        anything that drives the display or writes files. Serial calls act as
+        a barrier between the others.
+        """
+        return name == "str_replace_editor" and tool_input.get("command") == "view"
+
+    def batch(self) -> "ToolBatch":
+        return ToolBatch(self)
+
+    async def run_many(self, calls: list) -> list:
+        """Run (name, tool_input) pairs from one model turn, returning results in the same order."""
+        batch = self.batch()
+        for name, tool_input in calls:
+            batch.submit(name, tool_input)
+        return await batch.results()
+
+
+class ToolBatch:
+    """Dispatches the tool calls of a single model turn.
+
+    Serial calls wait for every call submitted before them. Parallel-safe
+    calls only wait for the last serial call, so consecutive file views run
+    concurrently. Calls can be submitted while the response is still
+    streaming.
+    """
+
+    def __init__(self, tools: ToolCollection):
+        self.tools = tools
+        self.tasks = []
+        self.barrier: Optional[asyncio.Task] = None
+        self.since_barrier = []
+        # (tool name, seconds) for every finished call
+        self.timings = []
+
+    def submit(self, name: str, tool_input: dict) -> asyncio.Task:
+        if self.tools.is_parallel_safe(name, tool_input):
+            waits = [self.barrier] if self.barrier else []
+            task = asyncio.create_task(self._run_after(waits, name, tool_input))
+            self.since_barrier.append(task)
+        else:
+            waits = ([self.barrier] if self.barrier else []) + self.since_barrier
+            task = asyncio.create_task(self._run_after(waits, name, tool_input))
+            self.barrier = task
+            self.since_barrier = []
+        self.tasks.append(task)
+        return task
+
+    async def _run_after(self, waits: list, name: str, tool_input: dict) -> ToolResult:
+        if waits:
+            await asyncio.wait(waits)
+        started = time.perf_counter()
+        result = await self.tools.run(name=name, tool_input=tool_input)
+        self.timings.append((name, time.perf_counter() - started))
+        return result
+
+    async def results(self) -> list:
+        try:
+            return await asyncio.gather(*self.tasks)
+        finally:
+            self.cancel()
+
+    def cancel(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+
+def make_tool_result(
+    result: ToolResult,
+    tool_use_id: str,
+    processor: Optional[ScreenshotProcessor] = None,
+) -> BetaToolResultBlockParam:
+    tool_result_content = []
+    is_error = False
+
+    if result.error:
+        is_error = True
+        tool_result_content = result.error
+    else:
+        if result.output:
+            tool_result_content.append(
+                {
+                    "type": "text",
+                    "text": result.output,
+                }
+            )
+        if result.base64_image:
+            processor = processor or ScreenshotProcessor()
+            tool_result_content.extend(processor.to_content(result.base64_image))
+
+    return {
+        "type": "tool_result",
+        "content": tool_result_content,
+        "tool_use_id": tool_use_id,
+        "is_error": is_error,
+    }
@@ -0,0 +1,390 @@
+import re
+from dataclasses import dataclass
+from html import escape
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple, Union
+
+# Elements whose content doesn't help reproduce how the page looks
+SKIP_TAGS = {"script", "noscript", "template", "iframe", "object", "embed", "base"}
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+# Attributes that only matter to scripts, analytics or assistive tech
+DROP_ATTRIBUTE_PREFIXES = ("on", "data-", "aria-", "js")
+DROP_ATTRIBUTES = {"nonce", "integrity", "crossorigin", "referrerpolicy", "tabindex"}
+MAX_ATTRIBUTE_CHARS = 100
+MAX_STYLE_ATTRIBUTE_CHARS = 300
+MAX_TEXT_CHARS = 300
+# Runs of at least this many structurally identical siblings are collapsed
+MIN_REPEAT = 3
+
+
+def estimate_tokens_from_chars(chars: int) -> int:
+    """Rough token count, at about four characters per token."""
+    return chars // 4
+
+
+class Node:
+    def __init__(self, tag: str, attrs: list):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List[Union["Node", str]] = []
+        self._signature: Optional[str] = None
+
+    @property
+    def elements(self) -> List["Node"]:
+        return [child for child in self.children if isinstance(child, Node)]
+
+    def signature(self) -> str:
+        """Tag, classes and child structure, ignoring text and other attributes."""
+        if self._signature is None:
+            classes = " ".join(sorted((dict(self.attrs).get("class") or "").split()))
+            inner = ",".join(child.signature() for child in self.elements)
+            self._signature = f"{self.tag}.{classes}({inner})"
+        return self._signature
+
+    def text(self) -> str:
+        return " ".join(
+            child.strip() if isinstance(child, str) else child.text()
+            for child in self.children
+        ).strip()
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document", [])
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        node = Node(tag, attrs)
+        self.stack[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_endtag(self, tag: str) -> None:
+        # Browsers tolerate unclosed elements, so close everything up to the
+        # nearest matching open tag and ignore stray end tags
+        if not any(node.tag == tag for node in self.stack[1:]):
+            return
+        while self.stack[-1].tag != tag:
+            self.stack.pop()
+        self.stack.pop()
+
+    def handle_data(self, data: str) -> None:
+        self.stack[-1].children.append(data)
+
+
+def shorten(value: str, limit: int) -> str:
+    if value.startswith("data:"):
+        return f"data:{value[5:].split(',', 1)[0]},... ({len(value)} bytes)"
+    if len(value) <= limit:
+        return value
+    return value[:limit] + "..."
+
+
+def compact_attributes(tag: str, attrs: list) -> str:
+    parts = []
+    for name, value in attrs:
+        if name in DROP_ATTRIBUTES or name.startswith(DROP_ATTRIBUTE_PREFIXES):
+            continue
+        if value is None:
+            parts.append(name)
+            continue
+        if name == "srcset":
+            # The first candidate is enough to know which image goes there
+            value = value.split(",")[0].strip()
+        limit = MAX_STYLE_ATTRIBUTE_CHARS if name == "style" else MAX_ATTRIBUTE_CHARS
+        parts.append(f'{name}="{escape(shorten(value, limit))}"')
+    return "".join(f" {part}" for part in parts)
+
+
+def split_css_rules(css: str) -> List[str]:
+    """Top level rules of a stylesheet, keeping at-rule blocks like @media whole."""
+    rules = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(css):
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                rules.append(css[start : i + 1].strip())
+                start = i + 1
+            depth = max(depth, 0)
+        elif char == ";" and depth == 0:
+            # Statement at-rules such as @import or @charset
+            rules.append(css[start : i + 1].strip())
+            start = i + 1
+    return [rule for rule in rules if rule]
+
+
+def loads_remote_font(rule: str) -> bool:
+    """Whether an @font-face rule has a source the replica can load from anywhere."""
+    sources = re.findall(r"url\(\s*['\"]?([^'\")]*)", rule)
+    return any(re.match(r"(https?:)?//", source) for source in sources)
+
+
+def compress_css(
+    stylesheets: List[str], keep_font_faces: bool = False
+) -> Tuple[List[str], int]:
+    """Deduplicated, minified rules of all stylesheets, and the rule count before.
+
+    @font-face rules with only relative or inline sources are dropped unless
+    `keep_font_faces` is set, for when the fonts are available to the
+    replica (crawl mode caches them). Ones with an absolute URL are kept.
+    """
+    css = re.sub(r"/\*.*?\*/", "", "\n".join(stylesheets), flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    # Space before a colon is a descendant combinator in a selector
+    # ("div :first-child"), so colons are only tightened in declarations,
+    # the innermost blocks
+    css = re.sub(
+        r"\{([^{}]*)\}", lambda m: "{" + re.sub(r"\s*:\s*", ":", m[1]) + "}", css
+    )
+    css = re.sub(r"url\((['\"]?)data:[^)]*\)", "url(data:...)", css)
+    rules = split_css_rules(css)
+    seen = set()
+    kept = []
+    for rule in rules:
+        if (
+            rule in seen
+            or rule.startswith("@import")
+            or (
+                rule.startswith("@font-face")
+                and not keep_font_faces
+                and not loads_remote_font(rule)
+            )
+        ):
+            continue
+        seen.add(rule)
+        kept.append(rule)
+    return kept, len(rules)
+
+
+@dataclass
+class CompressionReport:
+    chars_before: int
+    chars_after: int
+    css_rules_before: int = 0
+    css_rules_after: int = 0
+    repeats_collapsed: int = 0
+    truncated: bool = False
+
+    @property
+    def tokens_before(self) -> int:
+        return estimate_tokens_from_chars(self.chars_before)
+
+    @property
+    def tokens_after(self) -> int:
+        return estimate_tokens_from_chars(self.chars_after)
+
+    def __str__(self) -> str:
+        return (
+            f"HTML: {self.chars_before} -> {self.chars_after} chars "
+            f"(~{self.tokens_before} -> ~{self.tokens_after} tokens), "
+            f"CSS rules {self.css_rules_before} -> {self.css_rules_after}, "
+            f"{self.repeats_collapsed} repeated elements collapsed"
+            + (", truncated to fit the budget" if self.truncated else "")
+        )
+
+
+class _Renderer:
+    def __init__(self, lossy: bool = True):
+        # Whether to shorten long text and collapse repeated siblings
+        self.lossy = lossy
+        self.stylesheets: List[str] = []
+        self.repeats_collapsed = 0
+
+    def collect_styles(self, node: Node) -> None:
+        for child in node.elements:
+            if child.tag == "style":
+                self.stylesheets.append(
+                    "".join(c for c in child.children if isinstance(c, str))
+                )
+            else:
+                self.collect_styles(child)
+
+    def render(self, node: Node, out: List[str]) -> None:
+        if node.tag in SKIP_TAGS or node.tag == "style":
+            return
+        if node.tag == "meta" and not (
+            dict(node.attrs).get("charset")
+            or dict(node.attrs).get("name") == "viewport"
+        ):
+            return
+        if node.tag == "link" and "stylesheet" not in (
+            dict(node.attrs).get("rel") or ""
+        ):
+            return
+        if node.tag == "svg":
+            # Icon path data is long and useless to reproduce; keep the box
+            out.append(f"<svg{compact_attributes(node.tag, node.attrs)}></svg>")
+            return
+
+        out.append(f"<{node.tag}{compact_attributes(node.tag, node.attrs)}>")
+        if node.tag in VOID_TAGS:
+            return
+        self.render_children(node, out)
+        out.append(f"</{node.tag}>")
+
+    def render_children(self, node: Node, out: List[str]) -> None:
+        children = node.children
+        i = 0
+        while i < len(children):
+            child = children[i]
+            if isinstance(child, str):
+                text = re.sub(r"\s+", " ", child)
+                if text.strip():
+                    if self.lossy:
+                        text = shorten(text, MAX_TEXT_CHARS)
+                    out.append(escape(text, quote=False))
+                i += 1
+                continue
+
+            # Find the run of structurally identical element siblings, skipping
+            # whitespace between them
+            run = [child]
+            j = i + 1
+            while j < len(children):
+                sibling = children[j]
+                if isinstance(sibling, str):
+                    if sibling.strip():
+                        break
+                elif sibling.signature() == child.signature():
+                    run.append(sibling)
+                else:
+                    break
+                j += 1
+
+            if self.lossy and len(run) >= MIN_REPEAT:
+                self.render(run[0], out)
+                self.repeats_collapsed += len(run) - 1
+                examples = "; ".join(
+                    shorten(other.text(), 40) for other in run[1:6] if other.text()
+                )
+                out.append(
+                    f"<!-- {len(run) - 1} more <{child.tag}> like the one above"
+                    + (f", with text: {examples}" if examples else "")
+                    + " -->"
+                )
+                i = j
+            else:
+                self.render(child, out)
+                i += 1
+
+
+def compress_html(
+    html: str, max_tokens: int = 15000, keep_font_faces: bool = False
+) -> Tuple[str, CompressionReport]:
+    """Shrink a page's HTML to what matters for reproducing its look, within `max_tokens`.
+
+    Scripts, tracking attributes and SVG path data are dropped, CSS from all
+    <style> blocks is minified and deduplicated into one block, long attribute
+    values and data URIs are shortened. If that is over budget, long text is
+    shortened and runs of identical sibling markup (cards, list items, table
+    rows) become the first one plus a count. If the result is still over
+    budget, CSS is cut first (down to a quarter of the
+    budget), then the end of the body. Web fonts that aren't loaded from an
+    absolute URL are dropped unless `keep_font_faces` is set.
+    """
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+
+    renderer = _Renderer()
+    renderer.collect_styles(builder.root)
+    rules, rules_before = compress_css(renderer.stylesheets, keep_font_faces)
+
+    budget = max_tokens * 4
+    # Shortening and collapsing lose visible text, so they are only done
+    # when the page doesn't fit without them
+    for lossy in (False, True):
+        renderer = _Renderer(lossy)
+        out: List[str] = []
+        renderer.render_children(builder.root, out)
+        markup = "".join(out)
+        if len(markup) + sum(len(rule) for rule in rules) <= budget:
+            break
+
+    css_budget = max(budget - len(markup), budget // 4)
+    css = ""
+    kept_rules = 0
+    for rule in rules:
+        if len(css) + len(rule) > css_budget:
+            break
+        css += rule
+        kept_rules += 1
+    truncated = kept_rules < len(rules)
+
+    style = f"<style>{css}</style>" if css else ""
+    markup_budget = budget - len(style)
+    if len(markup) > markup_budget:
+        markup = markup[:markup_budget] + "<!-- truncated -->"
+        truncated = True
+
+    # The stylesheet goes before the markup so the body is what gets cut
+    compressed = style + markup
+    return compressed, CompressionReport(
+        chars_before=len(html),
+        chars_after=len(compressed),
+        css_rules_before=rules_before,
+        css_rules_after=kept_rules,
+        repeats_collapsed=renderer.repeats_collapsed,
+        truncated=truncated,
+    )
+
+
+def visible_words(html: str) -> set:
+    """Words of the page's visible text, to check how much of it survives."""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    words = set()
+
+    def walk(node: Node) -> None:
+        if node.tag in SKIP_TAGS or node.tag in ("style", "head"):
+            return
+        for child in node.children:
+            if isinstance(child, str):
+                words.update(re.findall(r"\w{3,}", child.lower()))
+            else:
+                walk(child)
+
+    walk(builder.root)
+    return words
+
+
+if __name__ == "__main__":
+    # Compare blind truncation with compression on saved pages:
+    # python html_compress.py page.html ...
+    import sys
+
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            html = f.read()
+        words = visible_words(html) or {""}
+        truncated = html[:50000]
+        compressed, report = compress_html(html)
+        print(f"{path}: {report}")
+        print(
+            f"  visible words kept: first 50k chars "
+            f"{len(words & visible_words(truncated)) / len(words):.0%} "
+            f"(~{estimate_tokens_from_chars(len(truncated))} tokens), "
+            f"compressed {len(words & visible_words(compressed)) / len(words):.0%} "
+            f"(~{report.tokens_after} tokens)"
+        )
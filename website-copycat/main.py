@@ -1,13 +1,29 @@
+import argparse
 import asyncio
 import base64
+import io
+import time
 from datetime import datetime
 from typing import Any, cast
-from anthropic import Anthropic
+from PIL import Image
+from anthropic import AsyncAnthropic
 from playwright.async_api import async_playwright
 from scrapybara import Scrapybara
 from scrapybara.anthropic import BashTool, ComputerTool, EditTool, ToolResult
 from dotenv import load_dotenv
+from engine import AgentLoop
+from helpers import ToolCollection
+from history import ContextBudget, ScreenshotRetention
+from html_compress import compress_html
+from crawl import AssetCache, page_links, page_slug, same_site
+from images import ScreenshotProcessor
+from pool import InstancePool
+from readiness import load_page, wait_until_ready
+from similarity import SimilarityScore, SimilarityTracker, compare
+from tiles import capture_tiles, tile_content
 import os
+import shlex
+import shutil
 
 UBUNTU_UBUNTU_SYSTEM_PROMPT = """
 <SYSTEM_CAPABILITY>
@@ -64,17 +80,54 @@ Your approach should be:
 
 
 class WebsiteCopycat:
-    def __init__(self, scrapybara_api_key: str, anthropic_api_key: str):
+    def __init__(
+        self,
+        scrapybara_api_key: str,
+        anthropic_api_key: str,
+        keep_screenshots: int | None = 3,
+        screenshot_processor: ScreenshotProcessor | None = None,
+        trace_path: str | None = None,
+        pool_size: int = 0,
+        pool_ttl: float = 15 * 60,
+        context_budget: int | None = 100_000,
+        html_budget: int = 15_000,
+        capture_timeout: float = 20,
+        tiled_capture: bool = False,
+        similarity_threshold: float | None = 0.95,
+        similarity_patience: int = 3,
+    ):
         self.scrapybara = Scrapybara(api_key=scrapybara_api_key, timeout=600)
-        self.anthropic = Anthropic(api_key=anthropic_api_key)
+        self.anthropic = AsyncAnthropic(api_key=anthropic_api_key)
         self.instance = None
+        self.keep_screenshots = keep_screenshots
+        self.screenshot_processor = screenshot_processor
+        self.trace_path = trace_path
+        self.context_budget = context_budget
+        self.html_budget = html_budget
+        self.capture_timeout = capture_timeout
+        self.tiled_capture = tiled_capture
+        self.similarity_threshold = similarity_threshold
+        self.similarity_patience = similarity_patience
+        # With a pool, instances are leased and returned instead of started and stopped
+        self.pool = (
+            InstancePool(self.scrapybara, size=pool_size, ttl=pool_ttl)
+            if pool_size > 0
+            else None
+        )
         self.browser = None
         self.page = None
+        # Cached asset files already copied to this instance
+        self.uploaded_assets: set[str] = set()
 
     async def start(self):
         """Start Scrapybara instance and browser"""
         print("Starting Scrapybara instance...")
-        self.instance = self.scrapybara.start(instance_type="small")
+        if self.pool:
+            self.instance = self.pool.lease("small")
+            # Start the next run's instance while this one is in use
+            self.pool.fill_in_background("small")
+        else:
+            self.instance = self.scrapybara.start(instance_type="small")
         print("Instance started: ", self.instance.id)
 
         # Start browser session
@@ -87,43 +140,173 @@ class WebsiteCopycat:
         self.page = await self.browser.new_page()
         print("Page created: ", await self.page.title())
 
-    async def capture_website(self, url: str) -> tuple[str, str]:
-        """Capture website content and screenshot"""
+    async def capture_website(
+        self, url: str, page=None, original_path: str = "/tmp/original.png"
+    ) -> tuple[str, list[dict]]:
+        """Capture website content and screenshot, as message content blocks"""
         print(f"Capturing website: {url}")
-        await self.page.goto(url)
+        started = time.monotonic()
+        page = page or self.page
 
-        # Wait and scroll for dynamic content
-        await self.page.wait_for_timeout(3000)
-        await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        await self.page.wait_for_timeout(2000)
+        # Wait for the network and DOM to settle, scrolling through the page
+        # so lazy loaded content comes in, rather than sleeping a fixed time
+        readiness = await load_page(page, url, max_seconds=self.capture_timeout)
+        print(readiness)
 
         # Get content and screenshot
-        content = await self.page.content()
-        await self.page.evaluate("window.scrollTo(0, 0)")
-        screenshot = await self.page.screenshot(
-            path="/tmp/original.png", full_page=True
+        content = await page.content()
+        if self.tiled_capture:
+            # Viewport-sized tiles keep text on long pages readable
+            tiles, tile_stats = await capture_tiles(page, stitch_path=original_path)
+            print(tile_stats)
+            screenshot_content = tile_content(tiles)
+        else:
+            screenshot = await page.screenshot(path=original_path, full_page=True)
+            screenshot_content = [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": "image/png",
+                        "data": base64.b64encode(screenshot).decode(),
+                    },
+                }
+            ]
+        print(f"Captured in {time.monotonic() - started:.1f}s")
+
+        return content, screenshot_content
+
+    async def crawl(
+        self, start_url: str, depth: int, max_pages: int = 10, pages: int = 4
+    ) -> list[tuple[str, str, list[dict], str]]:
+        """Capture `start_url` and the same-site pages it links to, `depth` links deep.
+
+        Up to `pages` pages are captured at once, each on its own page over
+        the one browser connection. Returns (url, content, screenshot,
+        original path) for up to `max_pages` pages, in the order found.
+        """
+        slots = asyncio.Semaphore(pages)
+        os.makedirs("/tmp/crawl", exist_ok=True)
+
+        async def capture(url: str):
+            async with slots:
+                page = await self.browser.new_page()
+                try:
+                    original_path = f"/tmp/crawl/{page_slug(url)}.png"
+                    content, screenshot = await self.capture_website(
+                        url, page, original_path
+                    )
+                    return url, content, screenshot, original_path
+                except Exception as e:
+                    print(f"Failed to capture {url}: {e}")
+                    return None
+                finally:
+                    await page.close()
+
+        captured = []
+        seen = {start_url}
+        level = [start_url]
+        for current_depth in range(depth + 1):
+            results = await asyncio.gather(*(capture(url) for url in level))
+            captured += [result for result in results if result]
+            level = []
+            if current_depth == depth:
+                break
+            for url, content, _, _ in (result for result in results if result):
+                links, _ = page_links(content, url)
+                for link in links:
+                    if len(seen) >= max_pages:
+                        break
+                    if same_site(link, start_url) and link not in seen:
+                        seen.add(link)
+                        level.append(link)
+        return captured
+
+    async def upload_assets(self, cache: AssetCache, names: dict) -> dict:
+        """Copy cached assets to this instance, returning {url: path on the instance}."""
+        # Stylesheets need the fonts and images they refer to alongside them
+        for name in cache.with_dependencies(names.values()):
+            if name not in self.uploaded_assets:
+                with open(cache.path(name), "rb") as f:
+                    data = base64.b64encode(f.read()).decode()
+                await asyncio.to_thread(
+                    self.instance.file.write,
+                    path=f"/tmp/assets/{name}",
+                    content=data,
+                    encoding="base64",
+                )
+                self.uploaded_assets.add(name)
+        return {url: f"/tmp/assets/{name}" for url, name in names.items()}
+
+    def create_UBUNTU_UBUNTU_SYSTEM_PROMPT(
+        self,
+        html_content: str,
+        index_path: str = "/tmp/index.html",
+        assets: dict | None = None,
+    ):
+        # Scripts, repeated markup and duplicate CSS are stripped so the body
+        # fits in the prompt instead of being cut off after the <head>. Web
+        # fonts are only kept when they were cached for the replica.
+        html_content, report = compress_html(
+            html_content, self.html_budget, keep_font_faces=bool(assets)
         )
-
-        return content, base64.b64encode(screenshot).decode()
-
-    def create_UBUNTU_UBUNTU_SYSTEM_PROMPT(self, html_content: str):
+        print(report)
+        asset_list = ""
+        if assets:
+            asset_list = (
+                "\nThe page's images, stylesheets and fonts are saved on this machine. Use these local files instead of the original URLs:\n"
+                + "\n".join(f"{url} -> {path}" for url, path in assets.items())
+                + "\n"
+            )
         return (
             UBUNTU_UBUNTU_SYSTEM_PROMPT
             + f"""
     
-I'll show you a website's HTML content and screenshot. Create a single index.html file that replicates this website's appearance.
-
-Here's the original website content:
-{html_content[:50000]}... (truncated)
+I'll show you a website's HTML content and screenshot. Create a single {index_path} file that replicates this website's appearance.
 
-Let's start by creating index.html and adding the initial HTML structure.
+Here's the original website content, with scripts removed and repeated elements collapsed into the first one plus a comment saying how many follow:
+{html_content}
+{asset_list}
+Let's start by creating {index_path} and adding the initial HTML structure.
+After each change to the file, its similarity to the original screenshot is added to the tool result; use the least similar parts it lists to decide what to fix next.
 Once you've created the file, open it in Chrome to check how it looks.
 Everytime you make a change, inspect the result by reloading it in the browser and taking a screenshot.
 Do not exit the loop or stop making tool calls until you've opened the file in Chrome and visually inspected it using screenshot at least once.
 Once you've inspected the file, compare it with the original screenshot and improve if needed, or provide your final reasoning in text about why it's satisfactory."""
         )
 
-    async def replicate_website(self, html_content: str, screenshot: str):
+    async def replica_digest(self, path: str = "/tmp/index.html") -> str | None:
+        """Hash of the replica's content on the instance, None if it doesn't exist."""
+        result = await asyncio.to_thread(
+            self.instance.bash, command=f"md5sum {shlex.quote(path)} 2>/dev/null"
+        )
+        output = ((result or {}).get("output") or "").split()
+        return output[0] if output else None
+
+    async def score_replica(
+        self, original: Image.Image, path: str = "/tmp/index.html"
+    ) -> SimilarityScore | None:
+        """Render the replica in its own page and compare it with the original."""
+        page = await self.browser.new_page()
+        try:
+            await page.goto(f"file://{path}")
+            await wait_until_ready(page, max_seconds=10, scroll=False)
+            replica = Image.open(io.BytesIO(await page.screenshot(full_page=True)))
+        except Exception as e:
+            print(f"Could not render the replica: {e}")
+            return None
+        finally:
+            await page.close()
+        return await asyncio.to_thread(compare, original, replica)
+
+    async def replicate_website(
+        self,
+        html_content: str,
+        screenshot: list[dict],
+        index_path: str = "/tmp/index.html",
+        original_path: str = "/tmp/original.png",
+        assets: dict | None = None,
+    ):
         """Use Claude to create a replica of the website"""
         print("Starting website replication...")
 
@@ -131,6 +314,7 @@ Once you've inspected the file, compare it with the original screenshot and impr
             ComputerTool(self.instance),
             BashTool(self.instance),
             EditTool(self.instance),
+            processor=self.screenshot_processor,
         )
 
         messages = [
@@ -141,136 +325,320 @@ Once you've inspected the file, compare it with the original screenshot and impr
                         "type": "text",
                         "text": f"""Here's a screenshot of the website you're trying to replicate:""",
                     },
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/png",
-                            "data": screenshot,
-                        },
-                    },
+                    *screenshot,
                 ],
             }
         ]
 
-        while True:
-            response = self.anthropic.beta.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=8192,
-                messages=messages,
-                system=[
-                    {"type": "text", "text": self.create_UBUNTU_UBUNTU_SYSTEM_PROMPT(html_content)}
-                ],
-                tools=tool_collection.to_params(),
-                betas=["computer-use-2024-10-22"],
+        # The original as captured, to score each version of the replica against
+        original = Image.open(original_path)
+        tracker = SimilarityTracker(
+            threshold=self.similarity_threshold or 1.0,
+            patience=self.similarity_patience,
+        )
+        # Content hash of the last version scored
+        scored_digest = None
+
+        def on_tool(name: str, tool_input: dict) -> None:
+            print(f"\nUsing tool: {name}")
+            print(f"Tool input: {tool_input}")
+
+        async def post_process(
+            name: str, tool_input: dict, result: ToolResult
+        ) -> ToolResult:
+            nonlocal scored_digest
+            # For bash commands with empty results, take a screenshot
+            if name == "bash" and not (
+                result.output or result.error or result.base64_image
+            ):
+                result = await tool_collection.run(
+                    name="computer", tool_input={"action": "screenshot"}
+                )
+
+            # Score every new version of the replica and tell Claude how close
+            # it is. Opening or printing the file doesn't count: only versions
+            # whose content changed are scored, so they alone use up patience.
+            may_change_replica = os.path.basename(index_path) in str(tool_input) and (
+                (name == "str_replace_editor" and tool_input.get("command") != "view")
+                or name == "bash"
             )
-
-            response_params = [block.model_dump() for block in response.content]
-            tool_result_content = []
-
-            # Process each content block in the response
-            for block in response_params:
-                if block["type"] == "text":
-                    print(f"\nClaude: {block['text']}")
-                elif block["type"] == "tool_use":
-                    print(f"\nUsing tool: {block['name']}")
-                    print(f"Tool input: {block['input']}")
-
-                    result = await tool_collection.run(
-                        name=block["name"], tool_input=block["input"]
+            digest = (
+                await self.replica_digest(index_path)
+                if self.similarity_threshold and may_change_replica
+                else None
+            )
+            if digest and digest != scored_digest:
+                scored_digest = digest
+                similarity = await self.score_replica(original, index_path)
+                if similarity:
+                    tracker.add(similarity.score)
+                    print(similarity.feedback())
+                    result = result.replace(
+                        output=f"{result.output or ''}\n\n{similarity.feedback()}".strip()
                     )
-                    print(f"Tool result: {result}")
-
-                    # For bash commands with empty results, take a screenshot
-                    if block["name"] == "bash" and (
-                        not result
-                        or (
-                            result.output == ""
-                            and result.error == ""
-                            and result.base64_image is None
-                        )
-                    ):
-                        result = await tool_collection.run(
-                            name="computer", tool_input={"action": "screenshot"}
-                        )
-
-                    if result:
-                        tool_result = {
-                            "type": "tool_result",
-                            "tool_use_id": block["id"],
-                            "content": (
-                                [{"type": "text", "text": result.output}]
-                                if result.output
-                                else []
-                            ),
-                            "is_error": bool(result.error),
-                        }
-
-                        if result.base64_image:
-                            tool_result["content"].append(
-                                {
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": "image/png",
-                                        "data": result.base64_image,
-                                    },
-                                }
-                            )
-
-                        tool_result_content.append(tool_result)
-
-            # Update chat history
-            messages.append({"role": "assistant", "content": response_params})
-
-            if tool_result_content:
-                messages.append({"role": "user", "content": tool_result_content})
-            else:
-                # If no tool results and Claude indicates completion, break
-                break
+            return result
+
+        def should_stop(blocks: list, tool_results: list) -> bool:
+            if not tool_results:
+                return True
+            if tracker.stop_reason:
+                print(f"Stopping: {tracker.stop_reason}")
+                return True
+            return False
+
+        loop = AgentLoop(
+            self.anthropic,
+            tool_collection,
+            # Built once per capture; the embedded HTML makes this prompt large
+            self.create_UBUNTU_UBUNTU_SYSTEM_PROMPT(
+                html_content, index_path, assets
+            ),
+            max_tokens=8192,
+            retention=ScreenshotRetention(
+                keep_last=self.keep_screenshots, min_removal=5
+            ),
+            context_budget=(
+                ContextBudget(self.context_budget) if self.context_budget else None
+            ),
+            on_text=lambda text: print(f"\nClaude: {text}"),
+            on_tool=on_tool,
+            post_process=post_process,
+            on_tool_result=lambda name, tool_input, result: print(
+                f"Tool result: {result}"
+            ),
+            should_stop=should_stop,
+            on_turn=lambda turn: print(turn.summary()),
+            trace_path=self.trace_path,
+        )
+        stats = await loop.run(messages)
+        print(stats.summary())
+        if tracker.scores:
+            print(tracker.summary())
 
     async def cleanup(self):
         """Clean up resources"""
         if self.browser:
             await self.browser.close()
-        if self.instance:
+        if self.instance and self.pool:
+            self.instance.browser.stop()
+            self.pool.release(self.instance)
+        elif self.instance:
             self.instance.stop()
 
 
-class ToolCollection:
-    """Tool collection for Claude"""
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Replicate a website as a single index.html with Claude"
+    )
+    parser.add_argument(
+        "--url",
+        default="https://ycombinator.com",
+        help="website to replicate (default: https://ycombinator.com)",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        help="crawl mode: also replicate same-site pages up to this many links from --url",
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        default=10,
+        help="most pages to replicate in crawl mode (default: 10)",
+    )
+    parser.add_argument(
+        "--capture-pages",
+        type=int,
+        default=4,
+        help="pages to load and capture at once in crawl mode (default: 4)",
+    )
+    parser.add_argument(
+        "--replicas",
+        type=int,
+        default=2,
+        help="instances replicating pages at once in crawl mode (default: 2)",
+    )
+    parser.add_argument(
+        "--out-dir",
+        default="site",
+        help="directory crawl mode writes the replicas and their assets to (default: site)",
+    )
+    parser.add_argument(
+        "--tile-diff",
+        action="store_true",
+        help="send only the changed regions of consecutive screenshots",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="append per-turn timing and token stats to this JSONL file",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=0,
+        help="keep this many started instances warm for the next run (default: 0, start and stop one per run)",
+    )
+    parser.add_argument(
+        "--pool-ttl",
+        type=int,
+        default=15,
+        help="minutes a pooled instance may sit idle before it is stopped (default: 15)",
+    )
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=100000,
+        help="summarize the oldest turns once the conversation is estimated to exceed this many tokens, 0 disables (default: 100000)",
+    )
+    parser.add_argument(
+        "--html-budget",
+        type=int,
+        default=15000,
+        help="tokens of compressed page HTML to include in the prompt (default: 15000)",
+    )
+    parser.add_argument(
+        "--capture-timeout",
+        type=float,
+        default=20,
+        help="most seconds to wait for the page to finish loading before capturing it (default: 20)",
+    )
+    parser.add_argument(
+        "--tiles",
+        action="store_true",
+        help="capture the page as overlapping viewport-sized screenshots instead of one full page image",
+    )
+    parser.add_argument(
+        "--similarity-threshold",
+        type=float,
+        default=0.95,
+        help="stop once the replica's SSIM against the original reaches this, 0 disables scoring (default: 0.95)",
+    )
+    parser.add_argument(
+        "--similarity-patience",
+        type=int,
+        default=3,
+        help="stop once this many versions in a row fail to improve the best score (default: 3)",
+    )
+    return parser.parse_args()
+
+
+def make_copycat(args: argparse.Namespace) -> WebsiteCopycat:
+    return WebsiteCopycat(
+        scrapybara_api_key=os.getenv("SCRAPYBARA_API_KEY"),
+        anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"),
+        screenshot_processor=ScreenshotProcessor(
+            format="JPEG", quality=85, dedupe_threshold=4, tile_diff=args.tile_diff
+        ),
+        trace_path=args.trace,
+        pool_size=args.pool_size,
+        pool_ttl=args.pool_ttl * 60,
+        context_budget=args.context_budget,
+        html_budget=args.html_budget,
+        capture_timeout=args.capture_timeout,
+        tiled_capture=args.tiles,
+        similarity_threshold=args.similarity_threshold or None,
+        similarity_patience=args.similarity_patience,
+    )
 
-    def __init__(self, *tools):
-        self.tools = tools
-        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
 
-    def to_params(self) -> list:
-        return [tool.to_params() for tool in self.tools]
+async def crawl_site(args: argparse.Namespace):
+    """Capture a site's pages and replicate each one into `args.out_dir`.
 
-    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
-        tool = self.tool_map.get(name)
-        if not tool:
-            return None
-        try:
-            return await tool(**tool_input)
-        except Exception as e:
-            print(f"Error running tool {name}: {e}")
-            return None
+    Each replica runs on its own instance, so up to `args.replicas` pages are
+    replicated at once. Assets are downloaded once into the shared cache and
+    copied to each instance at most once.
+    """
+    copycats = [make_copycat(args) for _ in range(max(args.replicas, 1))]
+    cache = AssetCache()
+    try:
+        for copycat in copycats:
+            await copycat.start()
 
+        started = time.monotonic()
+        pages = await copycats[0].crawl(
+            args.url, args.depth, args.max_pages, args.capture_pages
+        )
+        print(f"Captured {len(pages)} pages in {time.monotonic() - started:.1f}s")
+
+        # Fetch every page's assets together; ones shared between pages
+        # are downloaded once
+        page_assets = {
+            url: page_links(content, url)[1] for url, content, _, _ in pages
+        }
+        names = await cache.fetch_all(
+            list(dict.fromkeys(url for urls in page_assets.values() for url in urls))
+        )
+        print(cache.stats)
+
+        # Assets are uploaded to /tmp/assets and each replica is written to
+        # its page's directory, so create them on every instance up front
+        dirs = ["/tmp/assets"] + [f"/tmp/site/{page_slug(url)}" for url, *_ in pages]
+        mkdir = "mkdir -p " + " ".join(shlex.quote(path) for path in dirs)
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(copycat.instance.bash, command=mkdir)
+                for copycat in copycats
+            )
+        )
 
-async def main():
+        os.makedirs(os.path.join(args.out_dir, "assets"), exist_ok=True)
+        queue = asyncio.Queue()
+        for page in pages:
+            queue.put_nowait(page)
+
+        async def replicate_pages(copycat: WebsiteCopycat):
+            while not queue.empty():
+                url, content, screenshot, original_path = queue.get_nowait()
+                slug = page_slug(url)
+                index_path = f"/tmp/site/{slug}/index.html"
+                used = {
+                    asset: names[asset] for asset in page_assets[url] if asset in names
+                }
+                try:
+                    assets = await copycat.upload_assets(cache, used)
+                    await copycat.replicate_website(
+                        content, screenshot, index_path, original_path, assets
+                    )
+                    replica = await asyncio.to_thread(
+                        copycat.instance.file.read, path=index_path
+                    )
+                except Exception as e:
+                    print(f"Failed to replicate {url}: {e}")
+                    continue
+
+                # Point the replica at the output's copy of its assets
+                html = replica.content.replace("file:///tmp/assets/", "assets/")
+                html = html.replace("/tmp/assets/", "assets/")
+                with open(os.path.join(args.out_dir, f"{slug}.html"), "w") as f:
+                    f.write(html)
+                for name in cache.with_dependencies(used.values()):
+                    path = os.path.join(args.out_dir, "assets", name)
+                    if not os.path.exists(path):
+                        shutil.copyfile(cache.path(name), path)
+                print(f"Saved the replica of {url} to {args.out_dir}/{slug}.html")
+
+        await asyncio.gather(*(replicate_pages(copycat) for copycat in copycats))
+    finally:
+        await cache.close()
+        for copycat in copycats:
+            await copycat.cleanup()
+
+
+async def main(args: argparse.Namespace):
     # Load environment variables from .env file
     load_dotenv(override=True)
 
-    copycat = WebsiteCopycat(
-        scrapybara_api_key=os.getenv("SCRAPYBARA_API_KEY"),
-        anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"),
-    )
+    if args.depth is not None:
+        await crawl_site(args)
+        return
+
+    copycat = make_copycat(args)
 
     try:
         await copycat.start()
         print("Scrapybara instance started")
-        content, screenshot = await copycat.capture_website("https://ycombinator.com")
+        content, screenshot = await copycat.capture_website(args.url)
         print("Website captured")
         await copycat.replicate_website(content, screenshot)
     finally:
@@ -278,4 +646,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))
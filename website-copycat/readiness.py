@@ -0,0 +1,148 @@
+import time
+from dataclasses import dataclass
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+
+# Resolves with the number of DOM mutations seen once none have happened for
+# `quietMs`, or at `maxMs` regardless
+DOM_QUIET_JS = """
+([quietMs, maxMs]) => new Promise((resolve) => {
+    let mutations = 0;
+    let timer;
+    const done = () => {
+        observer.disconnect();
+        clearTimeout(timer);
+        clearTimeout(deadline);
+        resolve(mutations);
+    };
+    const observer = new MutationObserver((records) => {
+        mutations += records.length;
+        clearTimeout(timer);
+        timer = setTimeout(done, quietMs);
+    });
+    observer.observe(document, {
+        subtree: true,
+        childList: true,
+        attributes: true,
+        characterData: true,
+    });
+    timer = setTimeout(done, quietMs);
+    const deadline = setTimeout(done, maxMs);
+})
+"""
+
+# Scrolls down one viewport, returning whether the bottom of the page was reached
+SCROLL_STEP_JS = """
+(ratio) => {
+    window.scrollBy(0, Math.floor(window.innerHeight * ratio));
+    const bottom = window.scrollY + window.innerHeight;
+    return bottom >= document.documentElement.scrollHeight - 2;
+}
+"""
+
+
+@dataclass
+class ReadinessStats:
+    navigation_seconds: float = 0.0
+    network_idle_seconds: float = 0.0
+    dom_quiet_seconds: float = 0.0
+    scroll_seconds: float = 0.0
+    scroll_steps: int = 0
+    mutations: int = 0
+    # Whether any stage gave up at the deadline or step limit rather than finishing
+    timed_out: bool = False
+
+    @property
+    def total_seconds(self) -> float:
+        return (
+            self.navigation_seconds
+            + self.network_idle_seconds
+            + self.dom_quiet_seconds
+            + self.scroll_seconds
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"Page ready in {self.total_seconds:.1f}s "
+            f"(navigation {self.navigation_seconds:.1f}s, "
+            f"network idle {self.network_idle_seconds:.1f}s, "
+            f"DOM quiet {self.dom_quiet_seconds:.1f}s, "
+            f"scroll {self.scroll_seconds:.1f}s over {self.scroll_steps} steps, "
+            f"{self.mutations} mutations)"
+            + (", stopped at a limit" if self.timed_out else "")
+        )
+
+
+async def _wait_for_network_idle(page: Page, deadline: float) -> bool:
+    """False when the deadline passed first, e.g. on pages that poll forever."""
+    try:
+        await page.wait_for_load_state(
+            "networkidle", timeout=max(deadline - time.monotonic(), 0.001) * 1000
+        )
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+async def _wait_for_dom_quiet(page: Page, quiet_ms: int, deadline: float) -> int:
+    max_ms = max(int((deadline - time.monotonic()) * 1000), quiet_ms)
+    return await page.evaluate(DOM_QUIET_JS, [quiet_ms, max_ms])
+
+
+async def wait_until_ready(
+    page: Page,
+    max_seconds: float = 15,
+    quiet_ms: int = 500,
+    scroll: bool = True,
+    max_scroll_steps: int = 30,
+    stats: ReadinessStats | None = None,
+) -> ReadinessStats:
+    """Wait until the loaded page has settled, instead of sleeping a fixed time.
+
+    Waits for the network to go idle, then for the DOM to stop changing for
+    `quiet_ms`. With `scroll`, the page is then scrolled down a viewport at a
+    time, waiting for it to settle after each step so lazy loaded content
+    comes in, and scrolled back to the top. Every wait is bounded by
+    `max_seconds` in total; a page that never settles is used as it is then.
+    """
+    stats = stats or ReadinessStats()
+    deadline = time.monotonic() + max_seconds
+
+    started = time.monotonic()
+    if not await _wait_for_network_idle(page, deadline):
+        stats.timed_out = True
+    stats.network_idle_seconds = time.monotonic() - started
+
+    started = time.monotonic()
+    stats.mutations += await _wait_for_dom_quiet(page, quiet_ms, deadline)
+    stats.dom_quiet_seconds = time.monotonic() - started
+
+    if scroll:
+        started = time.monotonic()
+        at_bottom = False
+        while (
+            not at_bottom
+            and stats.scroll_steps < max_scroll_steps
+            and time.monotonic() < deadline
+        ):
+            at_bottom = await page.evaluate(SCROLL_STEP_JS, 0.9)
+            stats.scroll_steps += 1
+            # Shorter settle per step; lazy images start loading on scroll
+            stats.mutations += await _wait_for_dom_quiet(page, quiet_ms // 2, deadline)
+        if not at_bottom:
+            stats.timed_out = True
+        await page.evaluate("window.scrollTo(0, 0)")
+        # Let whatever the scroll triggered finish loading
+        if not await _wait_for_network_idle(page, deadline):
+            stats.timed_out = True
+        stats.scroll_seconds = time.monotonic() - started
+
+    return stats
+
+
+async def load_page(page: Page, url: str, **kwargs) -> ReadinessStats:
+    """Navigate to `url` and wait until it is ready, see `wait_until_ready`."""
+    stats = ReadinessStats()
+    started = time.monotonic()
+    await page.goto(url, wait_until="domcontentloaded")
+    stats.navigation_seconds = time.monotonic() - started
+    return await wait_until_ready(page, stats=stats, **kwargs)
@@ -0,0 +1,138 @@
+from dataclasses import dataclass, field
+import numpy as np
+from PIL import Image
+
+# Pages are compared at this width; enough for layout and large text, and
+# keeps scoring a tall page well under a second
+SCORE_WIDTH = 320
+BLOCK_SIZE = 8
+# SSIM stabilizing constants for 8-bit images
+C1 = (0.01 * 255) ** 2
+C2 = (0.03 * 255) ** 2
+
+
+def to_gray(image: Image.Image, width: int = SCORE_WIDTH) -> np.ndarray:
+    """Grayscale pixels of `image` scaled to `width`, keeping its aspect ratio."""
+    height = max(round(image.height * width / image.width), 1)
+    gray = image.convert("L").resize((width, height), Image.BILINEAR)
+    return np.asarray(gray, dtype=np.float64)
+
+
+def block_ssim(a: np.ndarray, b: np.ndarray, block: int = BLOCK_SIZE) -> np.ndarray:
+    """SSIM of each non-overlapping `block` x `block` cell of two same-sized images."""
+    rows, cols = a.shape[0] // block, a.shape[1] // block
+    a = a[: rows * block, : cols * block].reshape(rows, block, cols, block)
+    b = b[: rows * block, : cols * block].reshape(rows, block, cols, block)
+    mean_a = a.mean(axis=(1, 3))
+    mean_b = b.mean(axis=(1, 3))
+    var_a = a.var(axis=(1, 3))
+    var_b = b.var(axis=(1, 3))
+    covariance = (a * b).mean(axis=(1, 3)) - mean_a * mean_b
+    return ((2 * mean_a * mean_b + C1) * (2 * covariance + C2)) / (
+        (mean_a**2 + mean_b**2 + C1) * (var_a + var_b + C2)
+    )
+
+
+@dataclass
+class SimilarityScore:
+    score: float
+    # Mean SSIM of each horizontal band of the page, top to bottom
+    band_scores: list = field(default_factory=list)
+
+    def worst_bands(self, n: int = 3) -> list:
+        """(start %, end %, score) of the `n` least similar bands, worst first."""
+        size = 100 / len(self.band_scores)
+        order = np.argsort(self.band_scores)[:n]
+        return [
+            (round(i * size), round((i + 1) * size), self.band_scores[i]) for i in order
+        ]
+
+    def feedback(self) -> str:
+        worst = ", ".join(
+            f"{start}-{end}% down the page ({score:.2f})"
+            for start, end, score in self.worst_bands()
+        )
+        return (
+            f"Visual similarity to the original screenshot: {self.score:.3f} "
+            f"(SSIM, 1.0 is identical). Least similar parts: {worst}."
+        )
+
+
+def compare(
+    original: Image.Image, replica: Image.Image, bands: int = 10
+) -> SimilarityScore:
+    """Structural similarity of a replica's full page screenshot to the original's.
+
+    Both are scaled to the same width. The shorter one is padded with white
+    to the other's height, so missing or extra sections count against the
+    score rather than being ignored.
+    """
+    a = to_gray(original)
+    b = to_gray(replica)
+    height = max(a.shape[0], b.shape[0], BLOCK_SIZE)
+    a = np.pad(a, ((0, height - a.shape[0]), (0, 0)), constant_values=255)
+    b = np.pad(b, ((0, height - b.shape[0]), (0, 0)), constant_values=255)
+
+    ssim = block_ssim(a, b)
+    band_scores = [
+        float(band.mean())
+        for band in np.array_split(ssim, min(bands, ssim.shape[0]))
+        if band.size
+    ]
+    return SimilarityScore(float(ssim.mean()), band_scores)
+
+
+class SimilarityTracker:
+    """Scores of successive replicas, deciding when further iterations stop paying off.
+
+    Stops once a score reaches `threshold`, or once `patience` scores in a
+    row failed to beat the best score before them by `min_improvement`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        patience: int = 3,
+        min_improvement: float = 0.005,
+    ):
+        self.threshold = threshold
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.scores: list = []
+
+    @property
+    def best(self) -> float | None:
+        return max(self.scores) if self.scores else None
+
+    def add(self, score: float) -> None:
+        self.scores.append(score)
+
+    @property
+    def stop_reason(self) -> str | None:
+        if not self.scores:
+            return None
+        if self.scores[-1] >= self.threshold:
+            return f"similarity {self.scores[-1]:.3f} reached {self.threshold}"
+        if len(self.scores) > self.patience:
+            before = max(self.scores[: -self.patience])
+            if max(self.scores[-self.patience :]) < before + self.min_improvement:
+                return (
+                    f"similarity plateaued at {self.best:.3f} over the last "
+                    f"{self.patience} iterations"
+                )
+        return None
+
+    def summary(self) -> str:
+        return "Similarity per iteration: " + (
+            ", ".join(f"{score:.3f}" for score in self.scores) or "none"
+        )
+
+
+if __name__ == "__main__":
+    # Score replicas against an original: python similarity.py original.png replica.png ...
+    import sys
+
+    original = Image.open(sys.argv[1])
+    for path in sys.argv[2:]:
+        result = compare(original, Image.open(path))
+        print(f"{path}: {result.feedback()}")
@@ -0,0 +1,167 @@
+import asyncio
+import base64
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from PIL import Image
+from playwright.async_api import Page
+from images import MEDIA_TYPES
+
+PAGE_SIZE_JS = """
+() => [
+    window.innerWidth,
+    window.innerHeight,
+    Math.max(document.documentElement.scrollHeight, document.body.scrollHeight),
+]
+"""
+
+
+@dataclass
+class Tile:
+    data: str
+    media_type: str
+    # Position on the page in CSS pixels
+    top: int
+    height: int
+
+
+@dataclass
+class TileStats:
+    tiles: int = 0
+    page_height: int = 0
+    covered_height: int = 0
+    capture_seconds: float = 0.0
+    # Time spent waiting on encoding after the last tile was captured; the
+    # rest of the encoding overlaps with capturing
+    encode_wait_seconds: float = 0.0
+    encoded_bytes: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.covered_height < self.page_height
+
+    def __str__(self) -> str:
+        return (
+            f"Captured {self.tiles} tiles covering {self.covered_height} of "
+            f"{self.page_height}px in {self.capture_seconds:.1f}s "
+            f"(+{self.encode_wait_seconds:.1f}s encoding), "
+            f"{self.encoded_bytes // 1024} KB"
+            + (", cut at the pixel cap" if self.truncated else "")
+        )
+
+
+def tile_tops(page_height: int, tile_height: int, overlap: int) -> list[int]:
+    """Top edge of each tile so consecutive tiles share `overlap` pixels."""
+    step = max(tile_height - overlap, 1)
+    tops = list(range(0, max(page_height - overlap, 1), step))
+    return tops or [0]
+
+
+def encode_tile(png: bytes, format: str, quality: int) -> str:
+    image = Image.open(io.BytesIO(png))
+    buffer = io.BytesIO()
+    if format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.convert("RGB").save(buffer, format=format, quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def stitch_tiles(pngs: list[bytes], tops: list[int], width: int, path: str) -> None:
+    """Reassemble the tiles into one image of the captured part of the page."""
+    images = [Image.open(io.BytesIO(png)) for png in pngs]
+    # Screenshots are in device pixels, tile positions in CSS pixels
+    scale = images[0].width / width
+    height = round(tops[-1] * scale) + images[-1].height
+    canvas = Image.new("RGB", (images[0].width, height), "white")
+    for image, top in zip(images, tops):
+        canvas.paste(image, (0, round(top * scale)))
+    canvas.save(path)
+
+
+async def capture_tiles(
+    page: Page,
+    overlap: int = 100,
+    max_pixels: int = 12_000_000,
+    format: str = "JPEG",
+    quality: int = 85,
+    workers: int = 4,
+    stitch_path: str | None = None,
+) -> tuple[list[Tile], TileStats]:
+    """Screenshot the page as viewport-sized tiles from top to bottom.
+
+    Instead of one full page image, which the model scales down until text on
+    a long page is unreadable, each tile is a viewport high and overlaps the
+    next by `overlap` pixels so nothing is lost at the seams. Tiles are
+    encoded on a thread pool while the next one is captured. Tiling stops
+    once the tiles would exceed `max_pixels` in total. With `stitch_path`,
+    the captured tiles are also saved there as one image.
+    """
+    width, height, page_height = await page.evaluate(PAGE_SIZE_JS)
+    tops = tile_tops(page_height, height, overlap)
+    max_tiles = max(max_pixels // (width * height), 1)
+    tops = tops[:max_tiles]
+    stats = TileStats(page_height=page_height)
+
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    pngs = []
+    heights = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        encoding = []
+        for top in tops:
+            tile_height = max(min(height, page_height - top), 1)
+            png = await page.screenshot(
+                clip={"x": 0, "y": top, "width": width, "height": tile_height},
+                full_page=True,
+            )
+            pngs.append(png)
+            heights.append(tile_height)
+            encoding.append(
+                loop.run_in_executor(
+                    executor, encode_tile, png, format.upper(), quality
+                )
+            )
+        stats.capture_seconds = time.monotonic() - started
+
+        started = time.monotonic()
+        encoded = await asyncio.gather(*encoding)
+        if stitch_path:
+            await loop.run_in_executor(
+                executor, stitch_tiles, pngs, tops, width, stitch_path
+            )
+        stats.encode_wait_seconds = time.monotonic() - started
+
+    tiles = [
+        Tile(data, MEDIA_TYPES[format.upper()], top, tile_height)
+        for data, top, tile_height in zip(encoded, tops, heights)
+    ]
+    stats.tiles = len(tiles)
+    stats.covered_height = tops[-1] + heights[-1]
+    stats.encoded_bytes = sum(len(tile.data) for tile in tiles)
+    return tiles, stats
+
+
+def tile_content(tiles: list[Tile]) -> list[dict]:
+    """Image blocks for the tiles in page order, each labelled with its position."""
+    content = []
+    for i, tile in enumerate(tiles):
+        content.append(
+            {
+                "type": "text",
+                "text": f"Part {i + 1} of {len(tiles)}, page y={tile.top} to "
+                f"{tile.top + tile.height}px:",
+            }
+        )
+        content.append(
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": tile.media_type,
+                    "data": tile.data,
+                },
+            }
+        )
+    return content